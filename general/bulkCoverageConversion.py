@@ -12,28 +12,57 @@ the source data.
 Coverage files considered are in the coverageFiles list and include:
     'label', 'polygon', 'point', 'tic', 'annotation.vpf', 'node', 'arc'
 
+The coverages can also be converted without arcpy (--backend ogr, see
+coverageReportOgr) by the GDAL/OGR AVCBin driver into a GeoPackage per folder,
+e.g. on Linux. The script runs in Python 2.7 (ArcGIS) or 3.
+
+Progress is recorded in a journal (SQLite database, see openJournal) so that
+a run that is stopped can be restarted without converting again what has
+already been converted from unchanged coverages. Coverage files that failed
+are only tried again with the --retry-failed option. The output and feature
+count of each coverage file are also recorded and written to a summary CSV
+file (coverageCount.csv, see writeCountReport) at the end of the run.
+
 The log file is created each time the script is run with a unique date/version
 stamp. Review the log file for a record of what was processed and any data
 that failed processing (ERROR level reporting).
 
 Dependencies:
     os
-    arcpy
+    arcpy (arcpy backend) or GDAL/OGR (ogr backend)
     sys
     logging
     time
+    collections
+    argparse
+    multiprocessing
+    sqlite3
+    csv
 
 """
 #==============================================================================
 # Import modules
 #==============================================================================
 
+from __future__ import print_function
 
 import os
-import arcpy
 import logging as log
 import sys
 import time
+import collections
+import argparse
+import multiprocessing
+import sqlite3
+import csv
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+try:
+    from osgeo import ogr
+except ImportError:
+    ogr = None
 
 
 #==============================================================================
@@ -76,21 +105,265 @@ def stub(pathFileName):
     pathFileName -- the path being checked for its existence
 
     '''
-    print 'Unique stub search started (to create unique and matching log and zip file date/version stubs)'
+    print('Unique stub search started (to create unique and matching log and zip file date/version stubs)')
     tuple_time = time.localtime()
 
     ext = 0
-    print pathFileName
+    print(pathFileName)
 #    print os.path.join(pathFileName.split('.')[0] + "_" + time.strftime("%Y-%m-%d", tuple_time))
 #    print os.path.join(pathFileName.split('.')[0] + "_" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext) + '.log')
     while os.path.exists(os.path.join('zipFile' + "_" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)) + '.zip') or os.path.exists(os.path.join(pathFileName.split('.')[0] + "_" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)) + '.log'):
-        print os.path.join('zipFile' + "_" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext))
-        print "\tStub exists in either zip or log files: _" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)
+        print(os.path.join('zipFile' + "_" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)))
+        print("\tStub exists in either zip or log files: _" + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext))
         ext = ext + 1
-    print '\t\tNew stub to be written: _' + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)
+    print('\t\tNew stub to be written: _' + time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext))
     return time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)
 
-def coverageReport(folder, coverages, outFolder):
+def findCoverages(ws):
+    ''' Walk the folder structure once and find the coverages in it. A
+    coverage is a folder holding the 'arc.adf' and/or 'tic.adf' files, its
+    parent folder (the ArcInfo workspace) is the folder it is converted from.
+    The walk does not descend into the coverages or the 'info' folders and
+    folders reached twice (e.g. through a link) are only listed once.
+
+    Returns an ordered dictionary of workspace folder to the list of the
+    names of the coverages in it. Folders without coverages are left out.
+
+    Arguments
+    ws -- parent folder to recursively search for coverages
+    '''
+    signature = set(['arc.adf', 'tic.adf'])
+    workspaces = collections.OrderedDict()
+    visited = set()
+    for root, folders, files in os.walk(ws, followlinks=True):
+        key = os.path.normcase(os.path.realpath(root))
+        if key in visited:
+            del folders[:]
+            continue
+        visited.add(key)
+        coverageList = []
+        for f in sorted(folders):
+            try:
+                names = set(n.lower() for n in os.listdir(os.path.join(root, f)))
+            except OSError:
+                log.exception(os.path.join(root, f) + ' could not be listed')
+                continue
+            if names & signature:
+                coverageList.append(f)
+        if coverageList:
+            workspaces[root] = coverageList
+        # Only walk the folders that aren't coverages or INFO tables
+        folders[:] = [f for f in sorted(folders) if f not in coverageList and
+                      f.lower() != 'info']
+
+    return workspaces
+
+def openJournal(journalFile):
+    ''' Open (create if needed) the progress journal, a SQLite database with
+    a row for each coverage file type (or INFO table) with its status
+    ('pending', 'done', 'failed' or 'unsupported', see coverageReportOgr),
+    the modified time and size of the
+    source coverage when it was converted and the output and its feature
+    count.
+
+    Returns the database connection.
+
+    Arguments
+    journalFile -- path of the SQLite database
+    '''
+    # The worker processes share the journal, wait for each other's writes
+    connection = sqlite3.connect(journalFile, timeout=300)
+    connection.execute('CREATE TABLE IF NOT EXISTS journal ('
+                       'coverage TEXT, featureType TEXT, status TEXT, '
+                       'mtime REAL, size INTEGER, updated TEXT, '
+                       'output TEXT, featureCount INTEGER, '
+                       'PRIMARY KEY (coverage, featureType))')
+    # Journals from before the output and count were recorded
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(journal)')]
+    for column, columnType in [('output', 'TEXT'), ('featureCount', 'INTEGER')]:
+        if column not in columns:
+            connection.execute('ALTER TABLE journal ADD COLUMN ' + column + ' ' + columnType)
+    connection.commit()
+    return connection
+
+def coverageSignature(coverage):
+    ''' The latest modified time and the total size of the files of a
+    coverage (or the info folder), used to tell if it has changed since it
+    was converted.
+
+    Returns (mtime, size), (None, None) if it can't be read.
+
+    Arguments
+    coverage -- path of the coverage folder
+    '''
+    mtime, size = None, 0
+    try:
+        for n in os.listdir(coverage):
+            fileStat = os.stat(os.path.join(coverage, n))
+            mtime = max(mtime or 0, fileStat.st_mtime)
+            size += fileStat.st_size
+    except OSError:
+        return None, None
+    return mtime, size
+
+def combinedSignature(signature, infoSignature):
+    ''' The signature of a coverage combined with that of the info folder of
+    its workspace. The feature attribute tables (PAT, AAT) of a coverage are
+    held in the info folder, not the coverage folder, so an edit of the
+    attributes alone then also changes the signature. The info folder is
+    read once per workspace (see coverageSignature), not for each coverage.
+
+    Returns (mtime, size), (None, None) if the coverage can't be read.
+
+    Arguments
+    signature     -- (mtime, size) of the coverage
+    infoSignature -- (mtime, size) of the info folder, (None, None) if the
+                      workspace has none
+    '''
+    if signature[0] is None or infoSignature[0] is None:
+        return signature
+    return max(signature[0], infoSignature[0]), signature[1] + infoSignature[1]
+
+def journalPending(connection, coverage, featureType, signature, retryFailed=False):
+    ''' Check the journal for whether a coverage file type is to be
+    converted: it has not been converted, the conversion did not finish
+    (pending), the coverage has changed since it was converted or it failed
+    and retryFailed is set.
+
+    Arguments
+    connection  -- journal database connection (see openJournal)
+    coverage    -- path of the coverage
+    featureType -- coverage file type, e.g. 'arc', or INFO table name
+    signature   -- (mtime, size) of the coverage (see coverageSignature)
+    retryFailed -- convert the file types that failed in previous runs
+    '''
+    row = connection.execute('SELECT status, mtime, size FROM journal WHERE '
+                             'coverage = ? AND featureType = ?',
+                             (coverage, featureType)).fetchone()
+    if row is None or row[0] == 'pending' or tuple(row[1:]) != tuple(signature):
+        return True
+    return row[0] == 'failed' and retryFailed
+
+# Journal feature type of the row recorded once the run gets to the end of a
+# coverage, the file types are only journaled as they are reached so a run
+# stopped part way through a coverage leaves no record of those not reached
+coverageEnd = '(coverage)'
+
+def journalComplete(connection, coverage, signature, retryFailed=False):
+    ''' Check the journal for whether a whole coverage has been converted:
+    the run got to the end of the coverage (its coverageEnd row is recorded
+    with the signature) and none of its file types are to be converted (see
+    journalPending).
+
+    Arguments
+    connection  -- journal database connection (see openJournal)
+    coverage    -- path of the coverage
+    signature   -- (mtime, size) of the coverage (see coverageSignature)
+    retryFailed -- convert the file types that failed in previous runs
+    '''
+    featureTypes = [row[0] for row in connection.execute(
+        'SELECT featureType FROM journal WHERE coverage = ?', (coverage,))]
+    return coverageEnd in featureTypes and not any(
+        journalPending(connection, coverage, c, signature, retryFailed)
+        for c in featureTypes)
+
+def journalRecord(connection, coverage, featureType, status, signature,
+                  output=None, featureCount=None):
+    ''' Record the status of a coverage file type in the journal, committed
+    straight away so it survives the run being stopped.
+
+    Arguments
+    connection   -- journal database connection (see openJournal)
+    coverage     -- path of the coverage
+    featureType  -- coverage file type, e.g. 'arc', or INFO table name
+    status       -- 'pending', 'done', 'failed' or 'unsupported'
+    signature    -- (mtime, size) of the coverage (see coverageSignature)
+    output       -- feature class, table or layer written
+    featureCount -- number of features/rows written
+    '''
+    connection.execute('INSERT OR REPLACE INTO journal (coverage, featureType, '
+                       'status, mtime, size, updated, output, featureCount) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (coverage, featureType, status, signature[0],
+                        signature[1], time.strftime('%Y-%m-%d %H:%M:%S'),
+                        output, featureCount))
+    connection.commit()
+
+def writeCountReport(journalFile, csvFile):
+    ''' Write a summary of the conversion from the journal to a CSV file: the
+    status, output and feature count of each coverage file type and INFO
+    table, so a migration can be audited without searching the log files.
+
+    Arguments
+    journalFile -- progress journal (see openJournal)
+    csvFile     -- CSV file to be created/overwritten
+    '''
+    connection = openJournal(journalFile)
+    rows = connection.execute('SELECT coverage, featureType, status, '
+                              'featureCount, output, updated FROM journal '
+                              'WHERE featureType != ? ORDER BY coverage, '
+                              'featureType', (coverageEnd,)).fetchall()
+    connection.close()
+    # The csv module writes bytes in Python 2
+    if sys.version_info[0] == 2:
+        fh = open(csvFile, 'wb')
+    else:
+        fh = open(csvFile, 'w', newline='')
+    with fh:
+        writer = csv.writer(fh)
+        writer.writerow(['coverage', 'featureType', 'status', 'featureCount',
+                         'output', 'updated'])
+        writer.writerows(rows)
+    return len(rows)
+
+def outputFolder(folder, outFolder):
+    ''' The output folder for an input folder. The folder structure past
+    'GAB_hydrogeology' in the input folder is replicated in the outFolder to
+    link the output to the source data. The folder is created if needed.
+
+    Arguments
+    folder    -- input folder of the coverages
+    outFolder -- output folder
+    '''
+    # Split the folder path to use the path past this point to create the
+    # output folder structure to identify the link to source data
+    e = folder.split('GAB_hydrogeology')[1]
+    conCatFolder = outFolder + os.sep + e
+    print('\toutfolder: ' + conCatFolder)
+    if not os.path.exists(conCatFolder):
+        os.makedirs(conCatFolder)
+    return conCatFolder
+
+def infoTables(info):
+    ''' The names of the INFO tables in the info folder of a workspace, read
+    from its directory (arc.dir) without arcpy. The directory holds a 380
+    byte record for each table, the table name in the first 32 bytes and the
+    name of its data file (e.g. ARC0001) in the next 8. Tables whose data
+    file is missing (deleted) are left out.
+
+    Returns the lowercase table names, e.g. 'geol.pat', [] if there is no
+    directory.
+
+    Arguments
+    info -- path of the info folder
+    '''
+    tables = []
+    try:
+        with open(os.path.join(info, 'arc.dir'), 'rb') as fh:
+            while True:
+                record = fh.read(380)
+                if len(record) < 380:
+                    break
+                name = record[:32].decode('ascii', 'replace').strip().lower()
+                dataFile = record[32:40].decode('ascii', 'replace').strip().lower()
+                if name and os.path.exists(os.path.join(info, dataFile + '.dat')):
+                    tables.append(name)
+    except (IOError, OSError):
+        log.exception(os.path.join(info, 'arc.dir') + ' could not be read')
+    return tables
+
+def coverageReport(folder, coverages, outFolder, coverageList=None,
+                   failures=None, journalFile=None, retryFailed=False):
     ''' Create a list of coverages in the input folder and for each coverage
     iterate through the coverage file list (a coverage is a collection of files)
     and covert each file to a feature dataset in a File Geodatabase.
@@ -100,143 +373,398 @@ def coverageReport(folder, coverages, outFolder):
     structure is replicated.
 
     Arguments
-    folder    -- input folder to be assessed for coverages within
-    coverages -- number of coverages processed
-    outFolder -- output folder to where the input folder strucutre is then
-                  partly replicated and to house the converted data.
+    folder       -- input folder to be assessed for coverages within
+    coverages    -- number of coverages processed
+    outFolder    -- output folder to where the input folder strucutre is then
+                     partly replicated and to house the converted data.
+    coverageList -- names of the coverages in the folder (see findCoverages),
+                     listed with arcpy.ListDatasets if not given
+    failures     -- list the paths of the coverage files and tables that
+                     failed processing are appended to
+    journalFile  -- progress journal (see openJournal), coverage files and
+                     tables it records as converted are skipped
+    retryFailed  -- convert the coverage files and tables the journal
+                     records as failed
 
     '''
+    if failures is None:
+        failures = []
+    journal = openJournal(journalFile) if journalFile else None
     # List of coverage file types that are converted if they exist
     coverageFiles = ['label', 'polygon', 'point', 'tic', 'annotation.vpf', 'node', 'arc'] #''annotation.igds' exist but I'm not sure what they are - they cause erros
 
-    #Set the workspace, needed as this is where arcpy.ListDatasets() function identifies datasets
+    #Set the workspace, needed as this is where arcpy.ListDatasets() and
+    # arcpy.ListTables() functions identify datasets. All other paths are full
+    # paths so the workspace isn't changed while the folder is processed.
     arcpy.env.workspace = folder
-    print '  Workspace: ' + folder
+    print('  Workspace: ' + folder)
 
     #Work through the list of the coverages in the tile (folder)
     # note this uses the 'ListDatasets' function, not 'ListFeatureClasses'
-    coverageList = arcpy.ListDatasets('','Coverage')
-    print '\t',len(coverageList), 'Coverages found'
+    if coverageList is None:
+        coverageList = arcpy.ListDatasets('','Coverage')
+    print('\t',len(coverageList), 'Coverages found')
     if len(coverageList) == 0:
-        print '\t0 Coverages'
+        print('\t0 Coverages')
         log.info(folder)
         log.info('\t0 Coverages found')
     else:
-        # Split the folder path to use the path past this point to create the
-        # output folder structure to identify the link to source data
-        e = folder.split('GAB_hydrogeology')[1]
-        conCatFolder = outFolder + os.sep + e
-        print '\toutfolder: ' + conCatFolder
         # If the folder and file geodatabase don't exist in the output folder then create them
-        if not os.path.exists(conCatFolder):
-            os.makedirs(conCatFolder)
+        conCatFolder = outputFolder(folder, outFolder)
         if not arcpy.Exists(os.path.join(conCatFolder, "coverageConversion.gdb")):
             arcpy.CreateFileGDB_management(conCatFolder, "coverageConversion.gdb")
+        # The info folder is read once for all the coverages and the tables
+        info = os.path.join(folder, 'info')
+        infoSignature = coverageSignature(info)
 
         for f in coverageList:
-            print '#### ', f, ' ###'
+            print('#### ', f, ' ###')
             coverages += 1
-            print coverages, 'of total processed.', len(coverageList), 'coverages in', folder, 'being processed'
+            print(coverages, 'of total processed.', len(coverageList), 'coverages in', folder, 'being processed')
             # Validating table name is not picking up the first character being a number
             if f[0].isdigit():
                 fValid = '_' + arcpy.ValidateTableName(f)
             else:
                 fValid = arcpy.ValidateTableName(f)
-            print '\tValidated name to suit geodatabase:', fValid
+            print('\tValidated name to suit geodatabase:', fValid)
+            coverage = os.path.join(folder, f)
+            # Including the attribute tables in the info folder
+            signature = combinedSignature(coverageSignature(coverage), infoSignature)
+            if journal and journalComplete(journal, coverage, signature, retryFailed):
+                print('\tAlready converted (see the journal), skipped')
+                log.info(coverage + ' already converted (see the journal), skipped')
+                continue
             #Create a feature dataset for the coverage as per the coverage name, apply the Coodinate Reference System from the coverage to the feature dataset
             # Used try statement as where the coverage is corrupt the coordinate reference system can not be applied to the new feature dataset and causes the script to exit.
+            # An existing feature dataset is kept (overwriting it would delete
+            # the feature classes already converted into it)
             try:
                 # Usage: CreateFeatureDataset_management (out_dataset_path, out_name, {spatial_reference})
-                arcpy.CreateFeatureDataset_management(os.path.join(conCatFolder, "coverageConversion.gdb"),fValid,os.path.join(folder, f))
+                if not arcpy.Exists(os.path.join(conCatFolder, "coverageConversion.gdb",fValid)):
+                    arcpy.CreateFeatureDataset_management(os.path.join(conCatFolder, "coverageConversion.gdb"),fValid,os.path.join(folder, f))
             except:
-                print '### Could not create', os.path.join(conCatFolder, "coverageConversion.gdb",fValid)
+                print('### Could not create', os.path.join(conCatFolder, "coverageConversion.gdb",fValid))
+                failures.append(os.path.join(folder, f))
                 log.exception('### Could not create' + os.path.join(conCatFolder, "coverageConversion.gdb",fValid))
-            print '\tInput: ' + os.path.join(folder, f)
+            print('\tInput: ' + os.path.join(folder, f))
             #For coverage file type within a coverage convert this file to a feature class within the feature dataset
             if arcpy.Exists(os.path.join(conCatFolder, "coverageConversion.gdb",fValid)):
                 for c in coverageFiles:
                     try:
                         if arcpy.Exists(os.path.join(folder,f, c)):
-                            print '\t\t\t' + os.path.join(f, c), 'coverage exists'
+                            print('\t\t\t' + os.path.join(f, c), 'coverage exists')
                             log.info(os.path.join(folder,f, c) + ' coverage exists')
+                            if journal:
+                                if not journalPending(journal, coverage, c, signature, retryFailed):
+                                    print('\t\t\t\tAlready converted or failed (see the journal), skipped')
+                                    log.info('\t\t' + c + ' already converted or failed (see the journal), skipped')
+                                    continue
+                                journalRecord(journal, coverage, c, 'pending', signature)
                             #Treat the 'annotation.vpf' differently as the name needs to change, remove the '.' to be applied in the geodatabase
                             if c in ['annotation.vpf']:
-                                arcpy.arcpy.ImportCoverageAnnotation_conversion(f + os.sep + c, os.path.join(conCatFolder, "coverageConversion.gdb",fValid), arcpy.ValidateTableName(fValid + "_" + c.replace(".","_")),50000)
-                                print '\t\t\t\t' + c + ' converted to vpf table in ' + os.path.join(conCatFolder, "coverageConversion.gdb",fValid, fValid + "_" + c.replace(".","_"))
+                                arcpy.ImportCoverageAnnotation_conversion(os.path.join(folder, f, c), os.path.join(conCatFolder, "coverageConversion.gdb",fValid), arcpy.ValidateTableName(fValid + "_" + c.replace(".","_")),50000)
+                                print('\t\t\t\t' + c + ' converted to vpf table in ' + os.path.join(conCatFolder, "coverageConversion.gdb",fValid, fValid + "_" + c.replace(".","_")))
                                 log.info('\t\t'+ c + ' converted to vpf table in ' + os.path.join(conCatFolder, "coverageConversion.gdb",fValid, fValid + "_" + c.replace(".","_")))
-                                arcpy.env.workspace = os.path.join(conCatFolder, "coverageConversion.gdb",fValid)
-                                print '\t\t\t\t\t' + str(arcpy.GetCount_management(fValid + "_" + c.replace(".","_"))) + ' output rows counted'
-                                log.info('\t\t'+ str(arcpy.GetCount_management(fValid + "_" + c.replace(".","_"))) + ' output rows counted')
+                                output = os.path.join(conCatFolder, "coverageConversion.gdb",fValid, arcpy.ValidateTableName(fValid + "_" + c.replace(".","_")))
+                                # Counted once, the count is printed, logged and journaled
+                                count = int(arcpy.GetCount_management(output).getOutput(0))
+                                print('\t\t\t\t\t' + str(count) + ' output rows counted')
+                                log.info('\t\t'+ str(count) + ' output rows counted')
                             #For the remaining coverage file types convert them to a feature class in the feature dataset
                             else:
-                                arcpy.FeatureClassToFeatureClass_conversion(f + os.sep + c, os.path.join(conCatFolder, "coverageConversion.gdb",fValid), fValid + "_" + c)
-                                print '\t\t\t\t' + c + ' converted to feature class in ' + os.path.join(conCatFolder, "coverageConversion.gdb")
+                                arcpy.FeatureClassToFeatureClass_conversion(os.path.join(folder, f, c), os.path.join(conCatFolder, "coverageConversion.gdb",fValid), fValid + "_" + c)
+                                print('\t\t\t\t' + c + ' converted to feature class in ' + os.path.join(conCatFolder, "coverageConversion.gdb"))
                                 log.info('\t\t'+ c + ' converted to feature class in ' + os.path.join(conCatFolder, "coverageConversion.gdb"))
-                                arcpy.env.workspace = os.path.join(conCatFolder, "coverageConversion.gdb",fValid)
-                                print '\t\t\t\t\t\t' + str(arcpy.GetCount_management(fValid + "_" + c)) + ' output rows counted'
-                                log.info('\t\t\t'+ str(arcpy.GetCount_management(fValid + "_" + c)) + ' output rows counted')
-                            # Reset the workspace to the location of the coverages!!!
-                            arcpy.env.workspace = folder
+                                output = os.path.join(conCatFolder, "coverageConversion.gdb",fValid, fValid + "_" + c)
+                                count = int(arcpy.GetCount_management(output).getOutput(0))
+                                print('\t\t\t\t\t\t' + str(count) + ' output rows counted')
+                                log.info('\t\t\t'+ str(count) + ' output rows counted')
+                            if journal:
+                                journalRecord(journal, coverage, c, 'done', signature, output, count)
                         else:
-                            print '\t\t\t' + os.path.join(f, c), 'coverage does not exist'
+                            print('\t\t\t' + os.path.join(f, c), 'coverage does not exist')
                             log.info('\t\t'+ os.path.join(f, c) + 'coverage does not exist')
                     except:
-                        print os.path.join(folder,f,c), 'failed processing'
+                        print(os.path.join(folder,f,c), 'failed processing')
+                        failures.append(os.path.join(folder,f,c))
                         log.exception(os.path.join(folder,f,c) + ' failed processing')
+                        if journal:
+                            journalRecord(journal, coverage, c, 'failed', signature)
+                if journal:
+                    journalRecord(journal, coverage, coverageEnd, 'done', signature)
         #Import the tables into the geodatbase from the tile (folder)
-        print "\tTables being imported"
+        print("\tTables being imported")
         for t in arcpy.ListTables():
+            if journal:
+                if not journalPending(journal, info, t, infoSignature, retryFailed):
+                    print("\t\t" + t + ' already imported or failed (see the journal), skipped')
+                    log.info('\t\t' + t + ' already imported or failed (see the journal), skipped')
+                    continue
+                journalRecord(journal, info, t, 'pending', infoSignature)
             try:
                 if '.' in t:
-                    print "\t\t" + t
+                    print("\t\t" + t)
                     log.info('\t\t'+ t + ' exists')
                     arcpy.TableToTable_conversion(t, os.path.join(conCatFolder, "coverageConversion.gdb"),arcpy.ValidateTableName(t.split('.')[0] + "__" + t.split('.')[1]))
-                    print "\t\t\t" + t + ' imported'
+                    print("\t\t\t" + t + ' imported')
                     log.info('\t\t\t'+ t + ' imported')
                 else:
-                    print "\t\t" + t
+                    print("\t\t" + t)
                     log.info(t + ' exists')
                     arcpy.TableToTable_conversion(t, os.path.join(conCatFolder, "coverageConversion.gdb"),arcpy.ValidateTableName(t))
-                    print "\t\t\t" + t + ' imported'
+                    print("\t\t\t" + t + ' imported')
                     log.info('\t\t'+ t + ' imported')
+                # Counted once, as for the feature classes
+                output = os.path.join(conCatFolder, "coverageConversion.gdb", arcpy.ValidateTableName(t.replace('.', '__')))
+                count = int(arcpy.GetCount_management(output).getOutput(0))
+                print('\t\t\t\t' + str(count) + ' output rows counted')
+                log.info('\t\t\t'+ str(count) + ' output rows counted')
+                if journal:
+                    journalRecord(journal, info, t, 'done', infoSignature, output, count)
             except:
-                print os.path.join(folder,t), 'failed processing'
+                print(os.path.join(folder,t), 'failed processing')
+                failures.append(os.path.join(folder,t))
                 log.exception(os.path.join(folder,t) + ' failed processing')
+                if journal:
+                    journalRecord(journal, info, t, 'failed', infoSignature)
+    if journal:
+        journal.close()
 
 
 
-##        These lines were used to build an initial coverage list. The scipt would require
-##        reworking for this to be used, i.e. not simply uncommented.
-#        for c in coverageList:
-#            print '\t', c
-#            coverages += 1
-#            fh = open(CSV,"a")
-#            fh.write(os.path.join(root,f) + ',' + c + '\n')
-#            fh.close()
+    return coverages
 
+def coverageReportOgr(folder, coverages, outFolder, coverageList,
+                      failures=None, journalFile=None, retryFailed=False):
+    ''' Convert the coverages in the input folder as for coverageReport but
+    with the GDAL/OGR AVCBin driver in place of arcpy. Each coverage file
+    type is written as a layer, named as the feature class would be, to a
+    GeoPackage (coverageConversion.gpkg) in the output folder.
+
+    The driver reads the arc, label (LAB), polygon (PAL) and annotation
+    (TX6/TXT) files, with the attributes of their INFO tables (AAT, PAT).
+    The label points of a coverage without polygons are written as 'point'
+    as arcpy does. The tic and node files (the nodes are those of the arcs)
+    are not read by the driver, where the coverage has them they are logged
+    and journaled as 'unsupported' so they show in the summary CSV (see
+    writeCountReport) as not converted. Nor are the standalone INFO tables
+    (those not of a coverage in the folder, see infoTables), which are
+    logged and journaled as 'unsupported' in the same way.
+
+    Arguments
+    folder       -- input folder of the coverages
+    coverages    -- number of coverages processed
+    outFolder    -- output folder to where the input folder strucutre is then
+                     partly replicated and to house the converted data.
+    coverageList -- names of the coverages in the folder (see findCoverages)
+    failures     -- list the paths of the coverage files that failed
+                     processing are appended to
+    journalFile  -- progress journal (see openJournal), coverage files it
+                     records as converted are skipped
+    retryFailed  -- convert the coverage files the journal records as failed
+
+    '''
+    if failures is None:
+        failures = []
+    journal = openJournal(journalFile) if journalFile else None
+    # Coverage file types and the prefix of the OGR layer they are read from
+    coverageLayers = collections.OrderedDict([
+        ('label', 'LAB'), ('polygon', 'PAL'), ('point', 'LAB'), ('tic', None),
+        ('annotation.vpf', 'TX'), ('node', None), ('arc', 'ARC')])
+    # Coverage files of the file types the driver can't read
+    unsupportedFiles = {'tic': 'tic.adf', 'node': 'arc.adf'}
+
+    print('  Workspace: ' + folder)
+    print('\t',len(coverageList), 'Coverages found')
+    conCatFolder = outputFolder(folder, outFolder)
+    gpkg = os.path.join(conCatFolder, 'coverageConversion.gpkg')
+    outSource = ogr.Open(gpkg, 1) if os.path.exists(gpkg) else \
+        ogr.GetDriverByName('GPKG').CreateDataSource(gpkg)
+    # The info folder is read once for all the coverages
+    infoSignature = coverageSignature(os.path.join(folder, 'info'))
+
+    for f in coverageList:
+        print('#### ', f, ' ###')
+        coverages += 1
+        print(coverages, 'of total processed.', len(coverageList), 'coverages in', folder, 'being processed')
+        # Table names can't start with a number
+        fValid = '_' + f if f[0].isdigit() else f
+        coverage = os.path.join(folder, f)
+        # Including the attribute tables in the info folder
+        signature = combinedSignature(coverageSignature(coverage), infoSignature)
+        if journal and journalComplete(journal, coverage, signature, retryFailed):
+            print('\tAlready converted (see the journal), skipped')
+            log.info(coverage + ' already converted (see the journal), skipped')
+            continue
+
+        print('\tInput: ' + coverage)
+        try:
+            dataSource = ogr.Open(coverage)
+            layers = dict((dataSource.GetLayer(n).GetName().upper(), dataSource.GetLayer(n))
+                          for n in range(dataSource.GetLayerCount()))
+        except Exception:
+            print('### Could not open', coverage)
+            failures.append(coverage)
+            log.exception('### Could not open ' + coverage)
+            continue
+        hasPolygons = any(name.startswith('PAL') for name in layers)
+
+        for c, prefix in coverageLayers.items():
+            layer = None
+            if prefix and (c not in ('label', 'point') or (c == 'label') == hasPolygons):
+                layer = next((layers[name] for name in sorted(layers)
+                              if name.startswith(prefix)), None)
+            if layer is None:
+                if prefix:
+                    print('\t\t\t' + os.path.join(f, c), 'coverage does not exist')
+                    log.info('\t\t'+ os.path.join(f, c) + ' coverage does not exist')
+                elif os.path.exists(os.path.join(coverage, unsupportedFiles[c])):
+                    print('\t\t\t' + os.path.join(f, c), 'not read by the OGR AVCBin driver, not converted')
+                    log.warning('\t\t'+ os.path.join(f, c) + ' not read by the OGR AVCBin driver, not converted')
+                    if journal:
+                        journalRecord(journal, coverage, c, 'unsupported', signature)
+                continue
+            print('\t\t\t' + os.path.join(f, c), 'coverage exists')
+            log.info(os.path.join(folder,f, c) + ' coverage exists')
+            if journal:
+                if not journalPending(journal, coverage, c, signature, retryFailed):
+                    print('\t\t\t\tAlready converted or failed (see the journal), skipped')
+                    log.info('\t\t' + c + ' already converted or failed (see the journal), skipped')
+                    continue
+                journalRecord(journal, coverage, c, 'pending', signature)
+            try:
+                name = fValid + '_' + c.replace('.', '_')
+                outSource.StartTransaction()
+                try:
+                    outLayer = outSource.CopyLayer(layer, name, ['OVERWRITE=YES'])
+                    outSource.CommitTransaction()
+                except Exception:
+                    outSource.RollbackTransaction()
+                    raise
+                print('\t\t\t\t' + c + ' converted to layer ' + name + ' in ' + gpkg)
+                log.info('\t\t'+ c + ' converted to layer ' + name + ' in ' + gpkg)
+                count = outLayer.GetFeatureCount()
+                print('\t\t\t\t\t\t' + str(count) + ' output rows counted')
+                log.info('\t\t\t'+ str(count) + ' output rows counted')
+                if journal:
+                    journalRecord(journal, coverage, c, 'done', signature,
+                                  gpkg + os.sep + name, count)
+            except Exception:
+                print(os.path.join(folder,f,c), 'failed processing')
+                failures.append(os.path.join(folder,f,c))
+                log.exception(os.path.join(folder,f,c) + ' failed processing')
+                if journal:
+                    journalRecord(journal, coverage, c, 'failed', signature)
+        if journal:
+            journalRecord(journal, coverage, coverageEnd, 'done', signature)
+        dataSource = None
+
+    # Standalone INFO tables
+    info = os.path.join(folder, 'info')
+    prefixes = set(f.lower() for f in coverageList)
+    for t in infoTables(info) if os.path.isdir(info) else []:
+        if t.split('.')[0] not in prefixes:
+            print('\t\t' + t, 'not read by the OGR AVCBin driver, not converted')
+            log.warning('\t\t' + os.path.join(info, t) + ' not read by the OGR AVCBin driver, not converted')
+            if journal:
+                journalRecord(journal, info, t, 'unsupported', infoSignature)
+
+    outSource = None
+    if journal:
+        journal.close()
 
     return coverages
+
+def initWorker(logfile):
+    ''' Set up a worker process of the pool (see convertWorkspace) with its
+    own log file, named from the log file of the run and the process ID, as
+    the processes can't share the log file. Where the worker is forked it
+    inherits the handler of the run's log file, which is removed (so
+    log.basicConfig would do nothing) and replaced with the worker's own.
+    Existing outputs are overwritten as in the mainline.
+
+    Arguments
+    logfile -- log file of the run
+    '''
+    root = log.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = log.FileHandler(os.path.splitext(logfile)[0] + '_' +
+                              str(os.getpid()) + '.log', mode='w')
+    handler.setFormatter(log.Formatter('%(asctime)s,   Line:%(lineno)d %(levelname)s: %(message)s',
+                                       datefmt='%a %d/%b/%Y %I:%M:%S %p'))
+    root.addHandler(handler)
+    root.setLevel(log.DEBUG)
+    if arcpy:
+        arcpy.env.overwriteOutput = True
+    if ogr:
+        ogr.UseExceptions()
+
+def convertWorkspace(task):
+    ''' Convert the coverages of one folder in a worker process (see
+    coverageReport and coverageReportOgr). Each folder is written to its own
+    File Geodatabase (or GeoPackage) so the folders are independent of each
+    other.
+
+    Returns (folder, number of coverages processed, list of failures).
+
+    Arguments
+    task -- (folder, list of coverage names, outFolder, journalFile,
+             retryFailed, backend)
+    '''
+    folder, coverageList, outFolder, journalFile, retryFailed, backend = task
+    report = coverageReportOgr if backend == 'ogr' else coverageReport
+    failures = []
+    try:
+        coverages = report(folder, 0, outFolder, coverageList, failures,
+                           journalFile, retryFailed)
+    except:
+        log.exception(folder + ' failed processing')
+        coverages = 0
+        failures.append(folder)
+    return folder, coverages, failures
+
 #==============================================================================
 # Mainline
 #==============================================================================
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the coverages in a folder structure to File Geodatabases')
+    parser.add_argument('--ws', default=r'C:\workspace\input',
+                        help='Parent folder to recursively search for coverages')
+    parser.add_argument('--out-folder', default=r'C:\Workspace',
+                        help='Output folder for the converted data and the log file')
+    parser.add_argument('--backend', choices=['arcpy', 'ogr'],
+                        default='arcpy' if arcpy else 'ogr',
+                        help='Convert with arcpy to File Geodatabases or with the GDAL/OGR AVCBin driver to GeoPackages (default: arcpy if available)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of folders converted in parallel in separate processes, 0 for the number of CPUs (default: 1, in this process)')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Convert again the coverage files and tables the journal records as failed')
+    parser.add_argument('--journal', default=None,
+                        help='Progress journal (SQLite) to resume from (default: coverageConversion_journal.sqlite in the output folder)')
+    args = parser.parse_args()
+    if not {'arcpy': arcpy, 'ogr': ogr}[args.backend]:
+        sys.exit('The ' + args.backend + ' backend requires ' + ('arcpy' if args.backend == 'arcpy' else 'GDAL/OGR'))
+
     t0 = time.time()
 #    doctest.testmod()
-    print 'Script started'
+    print('Script started')
     coverageFiles = ['arc', 'label', 'polygon', 'tic', 'point', 'annotation.vpf', 'node']
     # Existing outputs will be overwritten
-    arcpy.env.overwriteOutput = True
+    if arcpy:
+        arcpy.env.overwriteOutput = True
+    if ogr:
+        ogr.UseExceptions()
     # Parent folder to recursively search for coverage files
-    # Requires user input
-    ws = r'C:\workspace\input'
-    outFolder = r'C:\Workspace'
+    ws = args.ws
+    outFolder = args.out_folder
     CSV = os.path.join(outFolder, 'coverageCount.csv')
 
     # Create a unique logfile based on date and integer
     versionStub = stub(os.path.join(outFolder,r'logfile.log'))
     logfile = os.path.join(outFolder, r'logfile_' + versionStub + '.log')
-    print '\nlogfile name:' + logfile
+    print('\nlogfile name:' + logfile)
 
     # Configure the logfile
     log.basicConfig(filename=logfile,
@@ -249,25 +777,52 @@ if __name__ == '__main__':
     log.info('Script started: ' + sys.argv[0])
     # Log the workspace to the logfile
     log.info('Workspace: ' + ws)
+    log.info('Backend: ' + args.backend)
+    # Progress journal, items already converted from unchanged coverages are skipped
+    journalFile = args.journal or os.path.join(outFolder, 'coverageConversion_journal.sqlite')
+    openJournal(journalFile).close()
+    log.info('Journal: ' + journalFile + (' (retrying failed)' if args.retry_failed else ''))
 
     coverages = 0
 
-    # Check for coverages in root of WS
-    coverages = coverageReport(ws,coverages, outFolder)
-
-    # Check for coverages in subfolders of WS
-    for root, folders, files in os.walk(ws):
-        counter = 0
-        for f in folders:
-            coverages = coverageReport(os.path.join(root,f), coverages, outFolder)
+    # Find the coverages in WS and its subfolders in a single pass
+    workspaces = findCoverages(ws)
+    print(len(workspaces), 'folders with', sum(len(c) for c in workspaces.values()), 'coverages found')
+    log.info(str(len(workspaces)) + ' folders with ' + str(sum(len(c) for c in workspaces.values())) + ' coverages found')
 
-            print str(coverages), 'processed.'
+    failures = []
+    if args.workers == 1:
+        report = coverageReportOgr if args.backend == 'ogr' else coverageReport
+        for folder, coverageList in workspaces.items():
+            coverages = report(folder, coverages, outFolder, coverageList, failures, journalFile, args.retry_failed)
 
+            print(str(coverages), 'processed.')
+    else:
+        # Convert the folders in parallel, each worker logs to its own file
+        pool = multiprocessing.Pool(args.workers or None, initWorker, (logfile,))
+        log.info('Worker pool: ' + str(args.workers or multiprocessing.cpu_count()) + ' processes, logs ' + os.path.splitext(logfile)[0] + '_<process ID>.log')
+        tasks = [(folder, coverageList, outFolder, journalFile, args.retry_failed, args.backend) for folder, coverageList in workspaces.items()]
+        for folder, count, folderFailures in pool.imap_unordered(convertWorkspace, tasks):
+            coverages += count
+            failures.extend(folderFailures)
+            print(str(coverages), 'processed.', folder, 'complete')
+            log.info(folder + ': ' + str(count) + ' coverages processed, ' + str(len(folderFailures)) + ' failures')
+        pool.close()
+        pool.join()
+
+    if failures:
+        print(len(failures), 'failed processing (see the log file)')
+        log.error(str(len(failures)) + ' failed processing:\n\t' + '\n\t'.join(failures))
+
+    # Summary of the status and feature count of each coverage file from the journal
+    rows = writeCountReport(journalFile, CSV)
+    print('Coverage counts (' + str(rows) + ' rows): ' + CSV)
+    log.info('Coverage counts (' + str(rows) + ' rows): ' + CSV)
 
 
     print('\nFinished at: ' + time.strftime("%c", time.localtime(time.time())))
     timer(t0)
-    print '\nScript finished: ', str(coverages), ' processed (all may not have been successful - see the log file.'
+    print('\nScript finished: ', str(coverages), ' processed (all may not have been successful - see the log file.')
     log.info('Processing complete. ' + str(coverages) + ' processed (some may have failed - search log file for ''ERROR'')')
 
 
@@ -12,21 +12,40 @@ Description:
     result, i.e. a spatial query will return a single feature not multiple
     features overlaid.
 
-    Checks are completed after the addition of the data via a spatial join to
-    match geometry. The expectation is that the number of rows should match
-    between the result of the selected rows of spatial join to the resultant
-    dataset and the input dataset. These results are written to the log file.
+    Checks are completed after the addition of the data by matching the
+    geometry of the input to the result (see verifyGeometry). The expectation
+    is that the number of features matched in the resultant dataset should
+    match the input dataset. These results, with the IDs of any features not
+    matched, are written to the log file.
 
     Finally the same check is completed for the final result agaisnt the list
     of input datasets in a reverse order. The last dataset in should have
     a 1:1 match whereas the last datset in the list is liklely to have other
     data added on top therefore the number of features selected won't match the
     input dataset row count. These results are written to the log file and
-    can be reviewed in light of the intial spatial join results via a manual
-    check of the result.
+    can be reviewed in light of the intial geometry check results via a
+    manual check of the result.
+
+    The GDAL backend (--backend gdal, see buildNationalTiled and
+    updateOverlay) runs the same precedence ordered update with GDAL/OGR and
+    GEOS through Shapely in place of Update_analysis. The extent is split
+    into a grid of tiles (--tiles, 1 for a single overlay of the whole
+    extent) run in parallel and the tiles are stitched back together into a
+    GeoPackage. No output is written where a tile fails unless
+    --allow-partial. It does not require arcpy or an ArcInfo licence so it
+    can be run on Linux.
+
+    The base dataset and the inputs are listed in a JSON manifest
+    (--manifest, default buildNationalDataset.json beside the script, see
+    loadManifest) with the priority, expected coordinate reference system and
+    enabled flag of each input. Inputs whose extents are disjoint are
+    updated together in one step (see planLevels) unless --sequential.
 
 Dependencies:
 Python 3.x and Python libraries as outlined in the 'Import libraries' section.
+arcpy (ArcInfo licence) for the arcpy backend, GDAL/OGR for the GDAL
+backend. Shapely 2 (and numpy) for either backend, the geometry check (see
+verifyGeometry) and the overlay of the GDAL backend use it.
 
 @author: Duncan Moore - Geoscience Australia March 2017
 """
@@ -43,8 +62,47 @@ import sys
 import doctest
 import unittest
 import shutil
-import arcinfo # Attempt to import arcinfo licence as this is required for update_Analysis
-import arcpy
+import argparse
+import collections
+import contextlib
+import csv
+import ctypes
+import hashlib
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+try:
+    import arcinfo # Attempt to import arcinfo licence as this is required for update_Analysis
+    import arcpy
+except ImportError:
+    # Without arcpy only the GDAL/Shapely backend can be run
+    arcpy = None
+try:
+    import resource
+except ImportError:
+    # Windows, see peakRss
+    resource = None
+try:
+    from osgeo import gdal, ogr, osr
+except ImportError:
+    # GDAL/OGR is only required for the GDAL backend
+    ogr = None
+try:
+    import numpy as np
+    import shapely
+except ImportError:
+    # Shapely (and numpy) are required for the geometry check (see
+    # verifyGeometry) with either backend and the overlay of the GDAL backend
+    shapely = None
+
+
+# Timing and resource use of each stage of the run (see profileStage) and
+# the CSV file each stage is appended to as it completes (see startProfile)
+stageProfile = []
+profileFile = None
+profileFields = ['stage', 'name', 'seconds', 'peakRssMB', 'childPeakRssMB',
+                 'inputCount', 'outputCount', 'outputBytes', 'slivers',
+                 'sliverArea']
 
 
 #==============================================================================
@@ -116,185 +174,1354 @@ def stub(pathFileName):
         "%Y-%m-%d", tuple_time) + "_v" + str(ext))
     return time.strftime("%Y-%m-%d", tuple_time) + "_v" + str(ext)
 
-def buildNational(inputs, national1MReclass, gdb):
+def peakRss():
+    '''
+    Peak resident set size (memory use) in MB of the process and, separately,
+    the largest peak of its child processes that have finished (e.g. the
+    GDAL backend workers). These are the peaks since the process started so
+    they are the peaks up to the end of a stage, not of the stage alone.
+
+    Returns (process peak, child peak), the child peak is None on Windows.
+    '''
+    if resource:
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        scale = 1048576.0 if sys.platform == 'darwin' else 1024.0
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+    # Windows: the peak working set of the process
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', ctypes.c_ulong),
+                    ('PageFaultCount', ctypes.c_ulong),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(
+        ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+        counters.cb)
+    return counters.PeakWorkingSetSize / 1048576.0, None
+
+def featureCount(dataset):
+    '''
+    Number of features in a dataset, None if it can't be counted (e.g. it
+    has been deleted). arcpy is used where available, otherwise OGR.
+
+    Arguments:
+    dataset -- Dataset to be counted
+    '''
+    try:
+        if arcpy:
+            return int(arcpy.GetCount_management(dataset)[0])
+        dataSource, layer = openLayer(dataset)
+        return layer.GetFeatureCount()
+    except Exception:
+        return None
+
+def folderSize(folder):
+    '''
+    Size on disk in bytes of the files in a folder, e.g. a file geodatabase.
+
+    Arguments:
+    folder -- Folder to be measured
+    '''
+    return sum(os.path.getsize(os.path.join(path, name))
+               for path, folders, names in os.walk(folder) for name in names)
+
+@contextlib.contextmanager
+def profileStage(stage, name, inputDatasets=(), outputDataset=None):
+    '''
+    Time a stage of the build and record it in stageProfile, and append it
+    to the profile CSV file if one has been started (see startProfile), with
+    the peak memory use (see peakRss), the feature counts of the
+    inputs and output and the size of the output. Where the output is a
+    feature class in a file geodatabase the size is the growth of the
+    geodatabase over the stage. Outputs in memory have no size. The stage
+    can add the sliver count and area (see sliverStats) to the record
+    given by the with statement.
+
+    Usage:
+    with profileStage('update', 'WA_50K', [national, update], output) as record:
+        arcpy.Update_analysis(national, update, output, "BORDERS", "#")
+        record['slivers'], record['sliverArea'] = datasetSliverStats(output, update)
+
+    Arguments:
+    stage         -- Type of stage, e.g. 'update'
+    name          -- Name of the stage, e.g. the input being processed
+    inputDatasets -- Datasets read by the stage (to be counted)
+    outputDataset -- Dataset written by the stage
+    '''
+    inputCount = sum(featureCount(dataset) or 0 for dataset in inputDatasets)
+    gdb = os.path.split(outputDataset)[0] if outputDataset else ''
+    gdb = gdb if gdb.lower().endswith('.gdb') and os.path.isdir(gdb) else None
+    sizeBefore = folderSize(gdb) if gdb else None
+    record = {}
+    t0 = time.time()
+    yield record
+    seconds = time.time() - t0
+
+    outputBytes = None
+    if gdb:
+        outputBytes = folderSize(gdb) - sizeBefore
+    elif outputDataset and os.path.isfile(outputDataset):
+        outputBytes = os.path.getsize(outputDataset)
+    peak, childPeak = peakRss()
+    stageProfile.append(collections.OrderedDict([
+        ('stage', stage), ('name', name), ('seconds', round(seconds, 3)),
+        ('peakRssMB', round(peak, 1)),
+        ('childPeakRssMB', round(childPeak, 1) if childPeak is not None
+         else None), ('inputCount', inputCount),
+        ('outputCount', featureCount(outputDataset) if outputDataset
+         else None),
+        ('outputBytes', outputBytes), ('slivers', record.get('slivers')),
+        ('sliverArea', record.get('sliverArea'))]))
+    log.info('\t\tProfile: {0}'.format(dict(stageProfile[-1])))
+    if profileFile:
+        with open(profileFile, 'a', newline='') as f:
+            csv.DictWriter(f, profileFields).writerow(stageProfile[-1])
+
+def startProfile(csvFile):
+    '''
+    Start the stage profile CSV file of the run. Each stage is appended as
+    it completes (see profileStage) so a build that fails part way still
+    leaves the profile of the stages up to the failure, and runs can be
+    compared.
+
+    Arguments:
+    csvFile -- CSV file to be created/overwritten
+    '''
+    global profileFile
+    with open(csvFile, 'w', newline='') as f:
+        csv.DictWriter(f, profileFields).writeheader()
+    profileFile = csvFile
+    print('Stage profile: ' + profileFile)
+    log.info('Stage profile: ' + profileFile)
+
+def updateSource(dataset, field, source):
+    '''
+    This function updates the table of features that have a NULL or empty
+    value in the 'field' parameter field. The table is updated with the
+    'source' input paramemter where the 'field' attribute is empty or NULL.
+    The cursor is limited by a where clause to the NULL or empty rows so
+    only the rows that are changed are read and written back.
+
+    Arguments:
+    dataset -- The dataset where the table is to be edited
+    field   -- The field to be checked/edited if NULL or empty
+    source  -- The name of the source feature dataset
+
+    '''
+    rowCount = 0
+    print('\t\tUpdating \'Source\' attribute...')
+    log.info('\t\tUpdating \'Source\' attribute...')
+    delimitedField = arcpy.AddFieldDelimiters(dataset, field)
+    whereClause = "{0} IS NULL OR {0} = ''".format(delimitedField)
+    # Create update cursor for the NULL or empty rows of the feature class
+    with arcpy.da.UpdateCursor(dataset, field, whereClause) as cursor:
+        for row in cursor:
+            rowCount += 1
+            row[0] = source
+            # Update the cursor
+            cursor.updateRow(row)
+
+    print('\t\tUpdated \'Source\' attribute: {} rows updated'.format(rowCount))
+    log.info('\t\tUpdated \'Source\' attribute: {} rows updated'.format(rowCount))
+    return
+
+def stampSource(dataset, stampedDataset, field, source):
+    '''
+    Copy a dataset and stamp the 'field' attribute of the copy with the
+    source name (see updateSource), adding the field if required. The copy
+    is used in the Update_analysis in place of the dataset so the source
+    data is not edited and, as the field is common to both datasets in the
+    update, the source name is carried through to the output. This avoids
+    a pass over the whole of the cumulative national dataset after each
+    update.
+
+    Returns the stamped dataset.
+
+    Arguments:
+    dataset        -- Dataset to be copied and stamped
+    stampedDataset -- Copy of the dataset to be created/overwritten
+    field          -- The field holding the source name
+    source         -- The name of the source feature dataset
+
+    '''
+    arcpy.CopyFeatures_management(dataset, stampedDataset)
+    if not arcpy.ListFields(stampedDataset, field):
+        arcpy.AddField_management(stampedDataset, field, "TEXT",
+                                  field_length = 30)
+    updateSource(stampedDataset, field, source)
+
+    return stampedDataset
+
+def datasetHash(dataset):
+    '''
+    Hash of the content of a dataset: the spatial reference and, in object
+    ID order, the geometry (as WKB) and attributes of every row. A change to
+    any feature changes the hash whereas copying or touching the dataset
+    without editing it does not.
+
+    Returns the SHA-1 hash as a hexadecimal string.
+
+    Arguments:
+    dataset -- Dataset to be hashed
+    '''
+    describe = arcpy.Describe(dataset)
+    fields = [field.name for field in arcpy.ListFields(dataset)
+              if field.type not in ('OID', 'Geometry', 'GlobalID')]
+    digest = hashlib.sha1(describe.spatialReference.exportToString().encode(
+        'utf-8'))
+    with arcpy.da.SearchCursor(dataset, ['SHAPE@WKB'] + fields, sql_clause=(
+            None, 'ORDER BY ' + describe.OIDFieldName)) as cursor:
+        for row in cursor:
+            digest.update(bytes(row[0] or b''))
+            digest.update(repr(row[1:]).encode('utf-8'))
+    return digest.hexdigest()
+
+def readCheckpoints(checkpointFile):
+    '''
+    Read the checkpoints of a previous build (see buildNational), a
+    dictionary of output dataset path to checkpoint key. Returns an empty
+    dictionary if there are none.
+
+    Arguments:
+    checkpointFile -- JSON file of checkpoints
+    '''
+    if not os.path.exists(checkpointFile):
+        return {}
+    with open(checkpointFile) as f:
+        return json.load(f)
+
+def writeCheckpoints(checkpointFile, checkpoints):
+    '''
+    Write the checkpoints of the build (see readCheckpoints).
+
+    Arguments:
+    checkpointFile -- JSON file of checkpoints to be created/overwritten
+    checkpoints    -- Dictionary of output dataset path to checkpoint key
+    '''
+    with open(checkpointFile, 'w') as f:
+        json.dump(checkpoints, f, indent=4, sort_keys=True)
+
+def buildNational(inputs, national1MReclass, gdb, checkpointFile=None,
+                  intermediates=None, keep=None, gridSize=None,
+                  snapTolerance=None):
     '''
     From an input list and a a file use the Update_analysis method to build
     a national dataset. The national dataset is incrementally updated based
     on previously added data.
 
+    The 'Source' attribute of the base dataset and of each input is stamped
+    on a copy before the update (see stampSource) so the national dataset
+    carries the name of the source of each feature without being edited
+    after each update. The copies are deleted once used.
+
+    Where a checkpoint file is given each intermediate dataset is recorded
+    with a key chaining the content hash (see datasetHash) of the base
+    dataset and of each input up to and including that step. A rerun
+    starts from the last intermediate whose key is unchanged and which
+    still exists, e.g. when only the last input has changed only the last
+    update is run.
+
+    Each step is named after the base dataset, the step number and the
+    input, e.g. AUS_1M_03_QLD_100K. By default every step is kept in the
+    geodatabase. Where keep is given only the final dataset and the keep
+    steps before it are kept in the geodatabase (as checkpoints); the
+    other steps are written to the intermediates workspace and deleted as
+    soon as the next step is complete.
+
+    Slivers are left where the boundaries of the datasets nearly but don't
+    quite coincide. To limit them the updates can be run with an XY
+    resolution (precision grid) and an XY tolerance, within which vertices
+    are snapped together. The sliver count and area among the features
+    clipped by each step are logged (see datasetSliverStats).
+
+    An item of the inputs list can be a list of datasets whose footprints
+    are disjoint (a level, see planLevels). These are merged and updated in
+    a single step rather than one after the other.
+
     Arguments:
-    inputs            -- Ordered list of datasets to be updated on top of
-                         dataset in the second argument and progressively
-                         the previously updated dataset
+    inputs            -- Ordered list of datasets (or lists of datasets) to
+                         be updated on top of dataset in the second argument
+                         and progressively the previously updated dataset
     national1MReclass -- Base dataset upon which the inputs list datasets
                          are progressively updated on top of
     gdb               -- ESRI Geodatabase to store the incrementally updated
                          datasets
+    checkpointFile    -- JSON file of the checkpoints (None to always run
+                         every step)
+    intermediates     -- Workspace for the steps and copies not kept:
+                         'memory', 'scratch' (the scratch geodatabase) or
+                         None for the geodatabase
+    keep              -- Number of steps before the final dataset to keep
+                         in the geodatabase (None to keep every step)
+    gridSize          -- XY resolution in the units of the base dataset
+                         (None for the default)
+    snapTolerance     -- XY tolerance in the units of the base dataset
+                         (None for the default)
 
     '''
-    def updateSource(outputDataset, field, source):
-        '''
-        This function updates the table of features that have a NULL or empty
-        value in the 'field' parameter field. The table is updated with the
-        'source' input paramemter where the 'field' attribute is empty or NULL.
-
-        Arguments:
-        outputDataset -- The dataset where the table is to be edited
-        field         -- The field to be checked/edited if NULL or empty
-        source        -- The name of the source feature dataset that has most
-                          recently been added to the national dataset
-
-        '''
-        rowCount = 0
-        print('\t\tUpdating \'Source\' attribute...')
-        log.info('\t\tUpdating \'Source\' attribute...')
-        # Create update cursor for feature class
-        with arcpy.da.UpdateCursor(outputDataset, field) as cursor:
-            # For each row, evaluate the 'field' value (index position
-            # of 0), and update 'field' if blank to the 'source'
-            for row in cursor:
-                if row[0] == None or row[0] == '':
-                    rowCount += 1
-                    row[0] = source
-
-                # Update the cursor
-                cursor.updateRow(row)
-
-        print('\t\tUpdated \'Source\' attribute: {} rows updated'.format(rowCount))
-        log.info('\t\tUpdated \'Source\' attribute: {} rows updated'.format(rowCount))
-        return
-
     print('\nStarting spatial join of input datasets to derived dataset...')
     log.info('Starting spatial join of input datasets to derived dataset...')
 
     # Set the overwrite to True so as to overwrite the layer files
     arcpy.env.overwriteOutput = True
 
-    print(len(inputs), ' feature classes to be updated:')
-    cumulativeName = ''
-    # Add a new field to the base dataset that all other data will be 'updated'
-    # on top of.
+    # Precision grid and snapping, in the units of the base dataset
+    spatialRef = arcpy.Describe(national1MReclass).spatialReference
+    units = ('DecimalDegrees' if spatialRef.type == 'Geographic' else
+             spatialRef.linearUnitName + 's')
+    if gridSize:
+        arcpy.env.XYResolution = '{0} {1}'.format(gridSize, units)
+    if snapTolerance:
+        arcpy.env.XYTolerance = '{0} {1}'.format(snapTolerance, units)
+
+    # Workspace of the datasets that are not kept
+    scratch = {'memory': 'memory', 'scratch': arcpy.env.scratchGDB,
+               None: gdb}[intermediates]
+
+    # Inputs grouped in levels are updated together (see planLevels)
+    levels = [list(i) if isinstance(i, (list, tuple)) else [i] for i in inputs]
+    print(sum(len(level) for level in levels), ' feature classes to be '
+          'updated in', len(levels), 'steps:')
+    # Field added to the base dataset, that all other data will be 'updated'
+    # on top of, and to each input, holding the name of the source dataset
     newField = 'Source'
-    arcpy.MakeFeatureLayer_management(national1MReclass, 'nationalLayer')
-    arcpy.AddField_management("nationalLayer", newField, "TEXT", field_length = 30)
-    # Calculate the Source field to match the name of the base dataset
-    updateSource('nationalLayer', newField, arcpy.ValidateTableName(
-                os.path.split(national1MReclass)[1]))
-    toBeUpdated = 'nationalLayer'
-    for i in inputs:
-        count = 0
-        print('\n\t', i)
-        log.info(i + ' update_Analysis onto ' + toBeUpdated)
+    baseName = arcpy.ValidateTableName(os.path.split(national1MReclass)[1])
+    stampedBase = os.path.join(scratch, arcpy.ValidateTableName(
+        'Source_' + baseName, scratch))
+
+    # The output of each step and its checkpoint key, the hash of the
+    # previous key and the content of the input, so a key only matches if
+    # none of the datasets up to and including that step have changed
+    checkpoints = readCheckpoints(checkpointFile) if checkpointFile else {}
+    key = ''
+    if checkpointFile:
+        print('\tHashing datasets...')
+        # The precision settings change every step
+        key = hashlib.sha1((datasetHash(national1MReclass) + repr(
+            (gridSize, snapTolerance))).encode('utf-8')).hexdigest()
+    steps = []
+    for n, level in enumerate(levels, 1):
+        # Steps before the last keep + 1 are not kept
+        kept = keep is None or n >= len(levels) - keep
+        stepWorkspace = gdb if kept else scratch
+        outputDataset = os.path.join(stepWorkspace, arcpy.ValidateTableName(
+            '{0}_{1:02d}_{2}'.format(baseName, n, '_'.join(
+                os.path.split(i)[1] for i in level)), stepWorkspace))
+        if checkpointFile:
+            for i in level:
+                key = hashlib.sha1((key + datasetHash(i)).encode('utf-8')).hexdigest()
+        steps.append((level, outputDataset, key, kept))
+
+    # Start after the last step with an unchanged checkpoint
+    start = 0
+    for n, (level, outputDataset, key, kept) in enumerate(steps):
+        if (checkpointFile and kept and checkpoints.get(outputDataset) == key
+                and arcpy.Exists(outputDataset)):
+            start = n + 1
+    for level, outputDataset, key, kept in steps[:start]:
+        print('\n\t', ', '.join(level), '\n\t\tUnchanged, checkpoint: ' +
+              outputDataset)
+        log.info(', '.join(level) + ' unchanged, checkpoint: ' + outputDataset)
+
+    if start == 0:
+        # Stamp the Source field of a copy of the base dataset to match the
+        # name of the base dataset, leaving the base dataset unchanged
+        with profileStage('stamp', baseName, [national1MReclass],
+                          stampedBase):
+            toBeUpdated = stampSource(national1MReclass, stampedBase,
+                                      newField, baseName)
+    else:
+        toBeUpdated = steps[start - 1][1]
+    outputDataset = toBeUpdated
+    for level, outputDataset, key, kept in steps[start:]:
+        print('\n\t', ', '.join(level))
+        log.info(', '.join(level) + ' update_Analysis onto ' + toBeUpdated)
+        # Stamp the Source field of a copy of each input before the update
+        stampedInputs = []
+        for i in level:
+            inputName = arcpy.ValidateTableName(os.path.split(i)[1])
+            stampedInputs.append(os.path.join(scratch, arcpy.ValidateTableName(
+                'Source_' + inputName, scratch)))
+            with profileStage('stamp', inputName, [i], stampedInputs[-1]):
+                stampSource(i, stampedInputs[-1], newField, inputName)
+        inputName = os.path.split(outputDataset)[1]
+        stampedInput = stampedInputs[0]
+        if len(level) > 1:
+            # The footprints of the inputs of a level are disjoint (see
+            # planLevels) so they are merged and updated in a single pass
+            stampedInput = os.path.join(scratch, arcpy.ValidateTableName(
+                'Merge_' + inputName, scratch))
+            with profileStage('merge', inputName, stampedInputs, stampedInput):
+                arcpy.Merge_management(stampedInputs, stampedInput)
         print('\t\tStarting Update...')
-        name = cumulativeName + '_' + arcpy.ValidateTableName(
-        os.path.split(i)[1])
-        #print os.path.join(gdb, os.path.split(national1MReclass)[1] + os.path.split(i)[1])
-        outputDataset = os.path.join(gdb, arcpy.ValidateTableName(
-            os.path.split(national1MReclass)[1] + name))
-        arcpy.Update_analysis(toBeUpdated,i,outputDataset,"BORDERS","#")
-        print('\t\tComplete Update of: ' + os.path.split(i)[1])
-        log.info('\tComplete Update of: ' + os.path.split(i)[1])
+        with profileStage('update', inputName, [toBeUpdated, stampedInput],
+                          outputDataset) as record:
+            arcpy.Update_analysis(toBeUpdated,stampedInput,outputDataset,"BORDERS","#")
+            # Only the features clipped by this update, not the whole
+            # cumulative dataset
+            record['slivers'], record['sliverArea'] = datasetSliverStats(
+                outputDataset, stampedInput)
+        print('\t\t', record['slivers'], 'slivers, area', record['sliverArea'],
+              'among the features clipped by the update')
+        log.info('\t\t{0} slivers, area {1}, among the features clipped by '
+                 'the update (those touching its footprint)'.format(
+                     record['slivers'], record['sliverArea']))
+        print('\t\tComplete Update of: ' + inputName)
+        log.info('\tComplete Update of: ' + inputName)
         log.info('\t\tOutput dataset: ' + outputDataset)
         print('\t\t\tOutput file: ' + outputDataset)
-        # Run and report on a spatial join to see that all the features were transferred
-        spatialJoin(i, outputDataset)
-        # Update the input file to be updated from that which has been created in the last Update_analysis process
-        toBeUpdated = os.path.join(gdb, arcpy.ValidateTableName(os.path.split(
-        national1MReclass)[1] + name))
+        # Record the checkpoint as soon as the step is complete so an
+        # interrupted build resumes from here
+        if checkpointFile and kept:
+            checkpoints[outputDataset] = key
+            writeCheckpoints(checkpointFile, checkpoints)
+        # Check and report that all the features were transferred
+        with profileStage('verify', inputName, level + [outputDataset]):
+            verifyGeometry(level, outputDataset)
 
-        if count == 0:
-            count += 1
-            updateSource(outputDataset, newField, arcpy.ValidateTableName(
-                os.path.split(i)[1]))
-        else:
-            updateSource(outputDataset, newField, arcpy.ValidateTableName(
-                os.path.split(i)[1]))
-        cumulativeName = name
+        # Rolling deletion of the datasets that have been used and are not
+        # kept: the stamped copies and the previous step if not kept
+        for stamped in set(stampedInputs + [stampedInput]):
+            arcpy.Delete_management(stamped)
+        if toBeUpdated == stampedBase or toBeUpdated not in [
+                step[1] for step in steps if step[3]]:
+            log.info('\t\tDeleting: ' + toBeUpdated)
+            arcpy.Delete_management(toBeUpdated)
+        # Update the input file to be updated from that which has been created in the last Update_analysis process
+        toBeUpdated = outputDataset
 
     print('\t\tCompleted update of input datasets to build national dataset.')
 
     return outputDataset
 
-def spatialJoin(i, combinedResult):
+def sourceName(dataset):
     '''
-    SpatialJoin function compares the geometry of two files and reports on the
-    match to the log file
+    Name of a dataset as recorded in the 'Source' attribute, i.e. the
+    feature class name validated as a table name where arcpy is available.
 
     Arguments:
-    i              -- Source feature class to be compared to second provided
-                      feature class
-    CombinedResult -- Result feature class to match to the geometry of the
-                      first provided feature class
+    dataset -- Path of the dataset, e.g. a feature class in a geodatabase
+    '''
+    name = os.path.split(dataset)[1]
+    if arcpy:
+        name = arcpy.ValidateTableName(name)
+    return name
 
+def openLayer(dataset):
     '''
+    Open a dataset with OGR. A feature class in a file geodatabase is opened
+    from its geodatabase by name, otherwise the first layer of the dataset
+    is used.
 
-    print('\tStarting spatial join of input datasets to derived dataset to'
-            ' confirm updated dataset matches source dataset')
-    log.info('\tStarting spatial join of input datasets to derived dataset to'
-            ' confirm updated dataset matches source dataset')
+    Returns the data source and layer (the data source must be kept
+    referenced while the layer is in use).
 
-    # Make a feature layer of input data as this is a required input to the
-    #  spatial selection tool
-    arcpy.MakeFeatureLayer_management(combinedResult, 'combo')
-    # Set the overwrite to True so as to overwrite the layer files
-    arcpy.env.overwriteOutput = True
+    Arguments:
+    dataset -- Path of the dataset, e.g. a feature class in a geodatabase
+    '''
+    folder, name = os.path.split(dataset)
+    if folder.lower().endswith('.gdb'):
+        dataSource = ogr.Open(folder)
+        layer = dataSource.GetLayerByName(name) if dataSource else None
+    else:
+        dataSource = ogr.Open(dataset)
+        layer = dataSource.GetLayer(0) if dataSource else None
+    if layer is None:
+        raise IOError('Unable to open ' + dataset + ' with OGR')
+    return dataSource, layer
+
+def layerSpatialRef(layer):
+    '''
+    Spatial reference of a layer with the traditional X/Y (longitude/
+    latitude) axis order so coordinates are not swapped between
+    coordinate reference systems.
+
+    Arguments:
+    layer -- OGR layer
+    '''
+    spatialRef = layer.GetSpatialRef().Clone()
+    spatialRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return spatialRef
+
+def projectedExtent(layer, spatialRef):
+    '''
+    Extent of an OGR layer projected into another spatial reference. The
+    edges of the extent are densified before projecting as they are curved
+    in the other reference system.
+
+    Returns (xmin, xmax, ymin, ymax) as for layer.GetExtent().
+
+    Arguments:
+    layer      -- OGR layer
+    spatialRef -- osr.SpatialReference the extent is projected into
+    '''
+    extent = layer.GetExtent()
+    ring = ogr.CreateGeometryFromWkt(
+        'POLYGON (({0} {2},{1} {2},{1} {3},{0} {3},{0} {2}))'.format(
+            *extent))
+    ring.Segmentize((extent[1] - extent[0]) / 20.0)
+    ring.AssignSpatialReference(layerSpatialRef(layer))
+    ring.TransformTo(spatialRef)
+    return ring.GetEnvelope()
+
+def tileGrid(datasets, tiles):
+    '''
+    Split the combined extent of the datasets, in the coordinate reference
+    system of the first (base) dataset, into a grid of tiles x tiles.
+
+    Returns the spatial reference (as WKT) and a list of tile extents
+    (xmin, ymin, xmax, ymax).
+
+    Arguments:
+    datasets -- List of dataset paths, the base dataset first
+    tiles    -- Number of tiles along each side of the grid
+    '''
+    dataSource, layer = openLayer(datasets[0])
+    baseRef = layerSpatialRef(layer)
+    xmin, xmax, ymin, ymax = layer.GetExtent()
+    for dataset in datasets[1:]:
+        dataSource, layer = openLayer(dataset)
+        # Project the extent of the input into the base reference system
+        extent = projectedExtent(layer, baseRef)
+        xmin, xmax = min(xmin, extent[0]), max(xmax, extent[1])
+        ymin, ymax = min(ymin, extent[2]), max(ymax, extent[3])
+
+    width = (xmax - xmin) / tiles
+    height = (ymax - ymin) / tiles
+    grid = []
+    for row in range(tiles):
+        for column in range(tiles):
+            # The last row/column ends exactly on the extent
+            grid.append((xmin + column * width, ymin + row * height,
+                         xmax if column == tiles - 1 else
+                         xmin + (column + 1) * width,
+                         ymax if row == tiles - 1 else
+                         ymin + (row + 1) * height))
+    return baseRef.ExportToWkt(), grid
+
+# Area and length fields maintained by the File Geodatabase (read as
+# ordinary fields by the OpenFileGDB driver) that would be wrong for the
+# clipped and stitched features, they are not written to the GeoPackage
+geometryFields = ('shape_area', 'shape_length')
+
+def readTile(dataset, tile, baseRef, index, field, gridSize=None):
+    '''
+    Read the features of a dataset that fall within a tile, projected into
+    the base reference system, clipped to the tile, made valid (see
+    validPolygonal) and, where a grid size is given, snapped to the
+    precision grid.
+
+    Returns a list of [origin, geometry, attributes] where the origin is
+    the (dataset index, FID) the piece was cut from, the geometry is a
+    Shapely geometry and the attributes a dictionary including the 'field'
+    attribute holding the name of the dataset, less the area and length
+    fields (see geometryFields).
+
+    Arguments:
+    dataset  -- Path of the dataset
+    tile     -- (xmin, ymin, xmax, ymax) of the tile in the base reference
+                system
+    baseRef  -- osr.SpatialReference of the base dataset
+    index    -- Position of the dataset in the update order (0 = base)
+    field    -- The field holding the source name
+    gridSize -- Precision grid size in the units of the base reference
+                system (None for full precision)
+    '''
+    dataSource, layer = openLayer(dataset)
+    layerRef = layerSpatialRef(layer)
+    transform = None
+    if not layerRef.IsSame(baseRef):
+        transform = osr.CoordinateTransformation(layerRef, baseRef)
+
+    # Filter the features on the tile, projected into the reference system
+    # of the layer so the spatial index of the layer can be used
+    tileGeometry = ogr.CreateGeometryFromWkb(shapely.to_wkb(
+        shapely.box(*tile)))
+    if transform:
+        tileGeometry.Segmentize((tile[2] - tile[0]) / 20.0)
+        tileGeometry.AssignSpatialReference(baseRef)
+        tileGeometry.TransformTo(layerRef)
+    layer.SetSpatialFilter(tileGeometry)
+
+    pieces = []
+    source = sourceName(dataset)[:30]
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is None:
+            continue
+        if transform:
+            geometry.Transform(transform)
+        piece = validPolygonal(shapely.clip_by_rect(shapely.from_wkb(bytes(
+            geometry.ExportToWkb())), *tile))
+        if gridSize:
+            piece = polygonal(shapely.set_precision(piece, gridSize))
+        if piece.is_empty:
+            continue
+        attributes = dict((name, value) for name, value in feature.items().items()
+                          if name.lower() not in geometryFields)
+        attributes[field] = source
+        pieces.append([(index, feature.GetFID()), piece, attributes])
+    return pieces
+
+def overlayTile(tile, datasets, levels, baseRefWkt, field, gridSize=None,
+                snapTolerance=None):
+    '''
+    Run the precedence ordered update for a single tile: the inputs of each
+    level, in order, replace the features of the previous result where they
+    overlap, as for Update_analysis with borders. This is the unit of work
+    run in each process by buildNationalTiled.
+
+    Returns a list of [origin, WKB, attributes] of the pieces in the tile
+    (see readTile) and a list of the [sliver count, sliver area] left by
+    the update of each level (see updateOverlay).
+
+    Arguments:
+    tile          -- (xmin, ymin, xmax, ymax) of the tile
+    datasets      -- List of dataset paths, the base dataset first
+    levels        -- List of the lists of the indices of the datasets
+                     updated together (see planLevels)
+    baseRefWkt    -- Spatial reference of the base dataset as WKT
+    field         -- The field holding the source name
+    gridSize      -- Precision grid size (None for full precision)
+    snapTolerance -- Distance within which the clipped features are snapped
+                     to the update features (None for no snapping)
+    '''
+    baseRef = osr.SpatialReference()
+    baseRef.ImportFromWkt(baseRefWkt)
+    baseRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    result = readTile(datasets[0], tile, baseRef, 0, field, gridSize)
+    stats = [[0, 0.0] for level in levels]
+    for level, levelStats in zip(levels, stats):
+        update = []
+        for index in level:
+            update.extend(readTile(datasets[index], tile, baseRef, index,
+                                   field, gridSize))
+        result = updateOverlay(result, update, gridSize, snapTolerance,
+                               levelStats)
+
+    return [[origin, shapely.to_wkb(geometry), attributes]
+            for origin, geometry, attributes in result], stats
 
-    print('\t\t', i)
-    log.info(i + ' geometry being assessed against ' + combinedResult)
-    # Make a feature layer of input data as this is a required input to the
-    #  spatial selection tool
-    arcpy.MakeFeatureLayer_management(i, 'source_layer')
-
-    # Run the spatial selection
-    arcpy.SelectLayerByLocation_management('combo', 'ARE_IDENTICAL_TO',
-                                           'source_layer' , '', 'NEW_SELECTION')
-    natCount = arcpy.GetCount_management('combo')#[0]
-    sourceCount = arcpy.GetCount_management(i)
-    # print/log the number of rows selected
-    print('\t\t', os.path.split(i)[1], ' selects ', str(natCount) ,
-          ' rows from ' , os.path.split(combinedResult)[1])
-    log.info(os.path.split(i)[1] +' selects ' + str(natCount) +
-    ' rows from ' + os.path.split(combinedResult)[1])
-    # print/log the number of rows in the selecting feature class - should be
-    #  the same
-    print('\t\t', str(sourceCount), ' rows in ', os.path.split(i)[1])
-    log.info('\t\t' + str(sourceCount) + ' rows in: ' + os.path.split(i)[1])
-    if int(natCount[0]) == int(sourceCount[0]):
-        print('\t\t\tSelected rows match')
-        log.info('\t\t\tSelected rows match')
+def updateOverlay(result, update, gridSize=None, snapTolerance=None,
+                  stats=None):
+    '''
+    The GEOS (Shapely) equivalent of Update_analysis with borders: the
+    features of the result are erased by the footprint of the update
+    features and the update features are added. An STRtree index of the
+    result finds the candidate features intersecting each update feature so
+    only those are clipped, each by the union of the update features it
+    intersects rather than by the footprint of the whole update.
+
+    Slivers are left where the boundaries of the datasets nearly but don't
+    quite coincide. To limit them the clipped features can be snapped to
+    the update features within the snap tolerance before clipping and the
+    clip carried out on the precision grid, which collapses slivers
+    narrower than the grid size.
+
+    Returns the updated list of [origin, geometry, attributes] pieces.
+
+    Arguments:
+    result        -- List of [origin, geometry, attributes] pieces to be
+                     updated (see readTile), the geometries are replaced
+                     where clipped
+    update        -- List of [origin, geometry, attributes] pieces to be
+                     added
+    gridSize      -- Precision grid size (None for full precision)
+    snapTolerance -- Distance within which the clipped features are snapped
+                     to the update features (None for no snapping)
+    stats         -- [sliver count, sliver area] to be added to with the
+                     slivers among the clipped features (see sliverStats)
+    '''
+    if not result or not update:
+        return result + update
+
+    updateGeometries = [piece[1] for piece in update]
+    tree = shapely.STRtree([piece[1] for piece in result])
+    # Pairs of the update features and the result features they intersect
+    updateIndex, resultIndex = tree.query(updateGeometries,
+                                          predicate='intersects')
+    erasers = collections.defaultdict(list)
+    for u, r in zip(updateIndex, resultIndex):
+        erasers[r].append(updateGeometries[u])
+
+    erased = []
+    clipped = []
+    for n, piece in enumerate(result):
+        if n in erasers:
+            eraser = shapely.union_all(erasers[n], grid_size=gridSize)
+            if snapTolerance:
+                piece[1] = validPolygonal(shapely.snap(piece[1], eraser,
+                                                       snapTolerance))
+            piece[1] = polygonal(shapely.difference(piece[1], eraser,
+                                                    grid_size=gridSize))
+            if piece[1].is_empty:
+                continue
+            clipped.append(piece[1])
+        erased.append(piece)
+
+    if stats is not None and clipped:
+        slivers, sliverArea = sliverStats(clipped)
+        stats[0] += slivers
+        stats[1] += sliverArea
+    return erased + update
+
+def sliverStats(geometries, thinness=0.1):
+    '''
+    Count and total area of the slivers among the polygons of a list of
+    geometries. A sliver is a polygon with a thinness ratio (4 pi area /
+    perimeter squared, 1 for a circle) below the threshold; 0.1 is about
+    that of a 1 x 30 rectangle.
+
+    Returns the sliver count and area.
+
+    Arguments:
+    geometries -- List of Shapely geometries
+    thinness   -- Thinness ratio below which a polygon is a sliver
+    '''
+    parts = shapely.get_parts(geometries)
+    area = shapely.area(parts)
+    perimeter = shapely.length(parts)
+    slivers = 4 * math.pi * area < thinness * perimeter ** 2
+    return int(np.count_nonzero(slivers)), float(area[slivers].sum())
+
+def datasetSliverStats(dataset, update=None, thinness=0.1):
+    '''
+    Count and total area of the slivers (see sliverStats) among the features
+    of a dataset read with arcpy. Multipart features are measured as a
+    whole. Where the update dataset of a step is given only the features
+    clipped by that update are measured, i.e. those that touch or overlap
+    the footprint of the update but are not update features (within it).
+    They are selected through the spatial index so the rest of the
+    cumulative dataset, including its legitimately thin features, is not
+    read, and the count is of the slivers left by that step alone.
+
+    Returns the sliver count and area.
+
+    Arguments:
+    dataset  -- Dataset to be measured
+    update   -- Update dataset of the step (None to measure every feature)
+    thinness -- Thinness ratio below which a feature is a sliver
+    '''
+    source = dataset
+    if update:
+        source = 'sliverStats'
+        arcpy.MakeFeatureLayer_management(dataset, source)
+        arcpy.SelectLayerByLocation_management(source, 'INTERSECT', update)
+        arcpy.SelectLayerByLocation_management(source, 'WITHIN', update,
+                                               selection_type='REMOVE_FROM_SELECTION')
+    slivers = 0
+    sliverArea = 0.0
+    try:
+        with arcpy.da.SearchCursor(source, ['SHAPE@AREA', 'SHAPE@LENGTH']) as cursor:
+            for area, perimeter in cursor:
+                if area is not None and 4 * math.pi * area < thinness * perimeter ** 2:
+                    slivers += 1
+                    sliverArea += area
+    finally:
+        if update:
+            arcpy.Delete_management(source)
+    return slivers, sliverArea
+
+def validPolygonal(geometry):
+    '''
+    The polygon parts (see polygonal) of a geometry, repaired with
+    make_valid where it is invalid. clip_by_rect and snap can both return
+    invalid geometries, which would otherwise raise a GEOS
+    TopologyException in the overlay.
+
+    Arguments:
+    geometry -- Shapely geometry
+    '''
+    if not shapely.is_valid(geometry):
+        geometry = shapely.make_valid(geometry)
+    return polygonal(geometry)
+
+def polygonal(geometry):
+    '''
+    The polygon parts of a geometry as a MultiPolygon, dropping any lines or
+    points left along the edges by an overlay.
+
+    Arguments:
+    geometry -- Shapely geometry
+    '''
+    parts = [part for part in shapely.get_parts(geometry)
+             if part.geom_type in ('Polygon', 'MultiPolygon')]
+    parts = shapely.get_parts(parts) if parts else []
+    return shapely.MultiPolygon(list(parts))
+
+def buildNationalTiled(inputs, national1MReclass, outputPath, tiles=10,
+                       workers=None, gridSize=None, snapTolerance=None,
+                       allowPartial=False):
+    '''
+    Build the national dataset as for buildNational but tile by tile, with
+    GDAL/OGR and Shapely in place of arcpy. The extent is split into a grid
+    of tiles x tiles (see tileGrid), the update of the inputs is run on each
+    tile in parallel in a process pool (see overlayTile) and the tiles are
+    stitched together by dissolving the pieces cut from the same feature.
+    The result, with the fields of the base dataset and inputs and the
+    'Source' attribute, is written to a GeoPackage. The sliver count and
+    area left by the update of each input and in the result are logged
+    (see updateOverlay for limiting slivers). As for buildNational an item
+    of the inputs list can be a list of datasets updated together. The
+    other tiles are run where a tile fails but no output is written, as it
+    would be missing the features of the failed tiles, unless allowPartial
+    is set, where the output is written and reported as partial.
+
+    Returns the path of the output. Raises RuntimeError if a tile failed and
+    allowPartial is not set.
+
+    Arguments:
+    inputs            -- Ordered list of datasets (or lists of datasets) to
+                         be updated on top of the base dataset and
+                         progressively the previously updated dataset
+    national1MReclass -- Base dataset upon which the inputs list datasets
+                         are progressively updated on top of
+    outputPath        -- GeoPackage to be created/overwritten
+    tiles             -- Number of tiles along each side of the grid
+    workers           -- Number of processes (default: the number of CPUs)
+    gridSize          -- Precision grid size in the units of the base
+                         dataset (None for full precision)
+    snapTolerance     -- Distance within which the clipped features are
+                         snapped to the update features (None for no
+                         snapping)
+    allowPartial      -- Write the output without the failed tiles
+    '''
+    gdal.UseExceptions()
+    newField = 'Source'
+    # The datasets, base first, and the indices of those in each level
+    datasets = [national1MReclass]
+    levels = []
+    for i in inputs:
+        level = list(i) if isinstance(i, (list, tuple)) else [i]
+        levels.append(list(range(len(datasets), len(datasets) + len(level))))
+        datasets.extend(level)
+    baseRefWkt, grid = tileGrid(datasets, tiles)
+    print('\nStarting tiled update of', len(datasets) - 1, 'feature classes in',
+          len(levels), 'steps over', len(grid), 'tiles...')
+    log.info('Starting tiled update over {0} tiles'.format(len(grid)))
+
+    # Output fields: those of the base dataset then any new fields of the
+    # inputs, as for Update_analysis, plus the Source field. The area and
+    # length fields of the File Geodatabase are left out (see geometryFields)
+    fieldDefinitions = collections.OrderedDict()
+    for dataset in datasets:
+        dataSource, layer = openLayer(dataset)
+        layerDefinition = layer.GetLayerDefn()
+        for n in range(layerDefinition.GetFieldCount()):
+            fieldDefinition = layerDefinition.GetFieldDefn(n)
+            if fieldDefinition.GetName().lower() not in geometryFields:
+                fieldDefinitions.setdefault(fieldDefinition.GetName(),
+                                            fieldDefinition)
+    sourceField = ogr.FieldDefn(newField, ogr.OFTString)
+    sourceField.SetWidth(30)
+    fieldDefinitions[newField] = sourceField
+
+    # Run the tiles in parallel, gathering the pieces of each feature
+    pieces = collections.OrderedDict()
+    attributes = {}
+    stats = [[0, 0.0] for level in levels]
+    with profileStage('tiles', '{0} tiles'.format(len(grid)), datasets) as record, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict((executor.submit(overlayTile, tile, datasets, levels,
+                                        baseRefWkt, newField, gridSize,
+                                        snapTolerance), tile) for tile in grid)
+        failedTiles = []
+        for n, future in enumerate(as_completed(futures), 1):
+            try:
+                tilePieces, tileStats = future.result()
+            except Exception:
+                failedTiles.append(futures[future])
+                print('\t{0} of {1} tiles: tile {2} failed'.format(
+                    n, len(grid), futures[future]))
+                log.exception('Tile {0} failed'.format(futures[future]))
+                continue
+            for origin, wkb, values in tilePieces:
+                pieces.setdefault(origin, []).append(wkb)
+                attributes[origin] = values
+            for total, tileTotal in zip(stats, tileStats):
+                total[0] += tileTotal[0]
+                total[1] += tileTotal[1]
+            print('\t{0} of {1} tiles complete'.format(n, len(grid)))
+        record['slivers'] = sum(total[0] for total in stats)
+        record['sliverArea'] = sum(total[1] for total in stats)
+    log.info('Tiles complete: {0} features'.format(len(pieces)))
+    if failedTiles:
+        log.error('{0} tiles failed: {1}'.format(len(failedTiles), failedTiles))
+        if not allowPartial:
+            raise RuntimeError('{0} tiles failed (see the log file), no output'
+                               ' written'.format(len(failedTiles)))
+        print('\t\t', len(failedTiles), 'tiles failed and are missing from'
+              ' the result (see the log file)')
+        log.warning('The failed tiles are missing from the result')
+    for level, (slivers, sliverArea) in zip(levels, stats):
+        names = ', '.join(os.path.split(datasets[index])[1] for index in level)
+        print('\t\t', slivers, 'slivers, area', sliverArea,
+              'left by the update of', names)
+        log.info('\t\t{0} slivers, area {1}, left by the update of {2}'.format(
+            slivers, sliverArea, names))
+
+    # Stitch the tiles together and write the result
+    with profileStage('stitch', os.path.split(outputPath)[1], (),
+                      outputPath) as record:
+        driver = ogr.GetDriverByName('GPKG')
+        if os.path.exists(outputPath):
+            driver.DeleteDataSource(outputPath)
+        spatialRef = osr.SpatialReference()
+        spatialRef.ImportFromWkt(baseRefWkt)
+        dataSource = driver.CreateDataSource(outputPath)
+        layer = dataSource.CreateLayer(
+            os.path.splitext(os.path.split(outputPath)[1])[0], srs=spatialRef,
+            geom_type=ogr.wkbMultiPolygon)
+        for fieldDefinition in fieldDefinitions.values():
+            layer.CreateField(fieldDefinition)
+        layerDefinition = layer.GetLayerDefn()
+
+        sourceCounts = collections.Counter()
+        written = []
+        dataSource.StartTransaction()
+        for origin in sorted(pieces):
+            geometries = shapely.from_wkb(pieces[origin])
+            # Dissolve the pieces cut from the same feature by the tile edges
+            geometry = polygonal(shapely.union_all(geometries,
+                                                   grid_size=gridSize)
+                                 if len(geometries) > 1 else geometries[0])
+            feature = ogr.Feature(layerDefinition)
+            feature.SetGeometry(ogr.CreateGeometryFromWkb(shapely.to_wkb(
+                geometry)))
+            for name, value in attributes[origin].items():
+                if value is not None:
+                    feature.SetField(name, value)
+            layer.CreateFeature(feature)
+            sourceCounts[attributes[origin][newField]] += 1
+            written.append(geometry)
+        dataSource.CommitTransaction()
+        dataSource = None
+        record['slivers'], record['sliverArea'] = sliverStats(written)
+    print('\t\tResult:', record['slivers'], 'slivers, area',
+          record['sliverArea'])
+    log.info('\t\tResult: {0} slivers, area {1}'.format(record['slivers'],
+                                                         record['sliverArea']))
+
+    for source, count in sourceCounts.items():
+        print('\t\t', count, 'features from', source)
+        log.info('\t\t{0} features from {1}'.format(count, source))
+    if failedTiles:
+        print('\t\tPARTIAL tiled update of input datasets to build national'
+              ' dataset, missing', len(failedTiles), 'tiles: ' + outputPath)
+        log.warning('Partial output dataset, missing {0} tiles: {1}'.format(
+            len(failedTiles), outputPath))
     else:
-        print('\t\t\tSelected rows don\'t match')
-        log.info('\t\t\tSelected rows don\'t match')
+        print('\t\tCompleted tiled update of input datasets to build national'
+              ' dataset: ' + outputPath)
+        log.info('Output dataset: ' + outputPath)
 
-    print('Completed spatial join of input datasets to derived dataset.')
+    return outputPath
 
-    return
+def normalisedGeometryHash(rings, tolerance):
+    '''
+    Hash of a polygon geometry that is the same for identical geometries
+    whichever way they have been written. The vertices are snapped to a grid
+    of the tolerance and duplicate and collinear vertices removed (e.g. the
+    vertices added where a feature was cut and rejoined), then each ring is
+    oriented anticlockwise and started from its lowest vertex and the rings
+    are sorted.
+
+    Returns the SHA-1 hash as a hexadecimal string, None for an empty
+    geometry (no rings left once normalised) which can't be matched.
+
+    Arguments:
+    rings     -- List of the rings of the geometry, each a list of X/Y
+                 vertices
+    tolerance -- Grid size the vertices are snapped to
+    '''
+    normalised = []
+    for ring in rings:
+        points = [(int(round(vertex[0] / tolerance)),
+                   int(round(vertex[1] / tolerance))) for vertex in ring]
+        # Remove the closing vertex and duplicate then collinear vertices
+        points = [point for n, point in enumerate(points)
+                  if point != points[n - 1]]
+        points = [point for n, point in enumerate(points)
+                  if (points[n - 1][0] - point[0]) *
+                  (points[(n + 1) % len(points)][1] - point[1]) !=
+                  (points[n - 1][1] - point[1]) *
+                  (points[(n + 1) % len(points)][0] - point[0])]
+        if len(points) < 3:
+            continue
+        # Shoelace formula, a negative area is a clockwise ring
+        area = sum(points[n - 1][0] * point[1] - point[0] * points[n - 1][1]
+                   for n, point in enumerate(points))
+        if area < 0:
+            points.reverse()
+        start = points.index(min(points))
+        normalised.append(tuple(points[start:] + points[:start]))
+
+    if not normalised:
+        return None
+    return hashlib.sha1(repr(sorted(normalised)).encode('utf-8')).hexdigest()
+
+def geometryRings(dataset, referenceDataset):
+    '''
+    Read the rings of each polygon in a dataset, projected into the
+    coordinate reference system of the reference dataset. arcpy is used
+    where available, otherwise OGR.
+
+    Yields (FID, rings) for each feature (see normalisedGeometryHash).
+
+    Arguments:
+    dataset          -- Dataset to be read
+    referenceDataset -- Dataset whose coordinate reference system is used
+    '''
+    if arcpy:
+        # WKB rather than JSON as true curves (curveRings) are densified
+        spatialRef = arcpy.Describe(referenceDataset).spatialReference
+        with arcpy.da.SearchCursor(dataset, ['OID@', 'SHAPE@WKB'],
+                                   spatial_reference=spatialRef) as cursor:
+            for oid, shape in cursor:
+                yield oid, polygonRings(shapely.from_wkb(bytes(shape))
+                                        if shape else None)
+        return
+
+    referenceSource, referenceLayer = openLayer(referenceDataset)
+    dataSource, layer = openLayer(dataset)
+    transform = None
+    if not layerSpatialRef(layer).IsSame(layerSpatialRef(referenceLayer)):
+        transform = osr.CoordinateTransformation(
+            layerSpatialRef(layer), layerSpatialRef(referenceLayer))
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is not None:
+            if transform:
+                geometry.Transform(transform)
+            geometry = shapely.from_wkb(bytes(geometry.ExportToWkb()))
+        yield feature.GetFID(), polygonRings(geometry)
 
-def inputsExist(inputs,combinedResult):
+def polygonRings(geometry):
     '''
-    The inputsExists function tests whether the input datasets exist. If they
-    don't then the script stops. This function uses the ArcPy exists method
-    and therefore is capable of testing the existence of ESRI Geodatabases.
+    The rings of the polygons of a geometry, each a sequence of X/Y
+    vertices (see normalisedGeometryHash). A null or empty geometry has no
+    rings.
+
+    Arguments:
+    geometry -- Shapely geometry or None
+    '''
+    rings = []
+    if geometry is not None:
+        for polygon in shapely.get_parts(polygonal(geometry)):
+            rings.append(polygon.exterior.coords)
+            rings.extend(interior.coords for interior in polygon.interiors)
+    return rings
+
+def verifyGeometry(inputs, combinedResult, tolerance=None):
+    '''
+    Check that the geometry of each input is found unchanged in the combined
+    result, replacing a spatial selection of identical features. The
+    normalised geometry of every feature of the result is hashed once (see
+    normalisedGeometryHash) and each feature of the inputs is matched on its
+    hash. The number of features matched and the IDs of those not matched
+    are reported to the log file. As for the update, the last input should
+    match in full whereas earlier inputs may be partly covered by later
+    inputs. Null and empty geometries are never matched.
+
+    Returns a dictionary of input to (matched count, list of the IDs of the
+    features not matched).
+
+    Arguments:
+    inputs         -- List of datasets to be checked
+    combinedResult -- Result feature class to match to the geometry of the
+                      inputs
+    tolerance      -- Grid size the vertices are snapped to before hashing,
+                      in the units of the result (default: the XY tolerance
+                      of the result, or 1 mm / 1e-8 degrees with OGR)
+    '''
+    print('\tStarting geometry check of input datasets to derived dataset to'
+          ' confirm updated dataset matches source dataset')
+    log.info('\tStarting geometry check of input datasets to derived dataset'
+             ' to confirm updated dataset matches source dataset')
+
+    if tolerance is None:
+        if arcpy:
+            tolerance = arcpy.Describe(combinedResult).spatialReference.XYTolerance
+        else:
+            dataSource, layer = openLayer(combinedResult)
+            tolerance = 1e-8 if layerSpatialRef(layer).IsGeographic() else 0.001
+
+    resultHashes = collections.Counter(
+        normalisedGeometryHash(rings, tolerance)
+        for oid, rings in geometryRings(combinedResult, combinedResult))
+    # Empty geometries all hash the same so would match each other
+    resultHashes.pop(None, None)
+
+    results = collections.OrderedDict()
+    for i in inputs:
+        # Each feature of the result can only be matched once
+        available = collections.Counter(resultHashes)
+        matched = 0
+        unmatched = []
+        for oid, rings in geometryRings(i, combinedResult):
+            geometryHash = normalisedGeometryHash(rings, tolerance)
+            if available[geometryHash] > 0:
+                available[geometryHash] -= 1
+                matched += 1
+            else:
+                unmatched.append(oid)
+        results[i] = (matched, unmatched)
+
+        print('\t\t', os.path.split(i)[1], ' matches ', matched, ' of ',
+              matched + len(unmatched), ' features in ',
+              os.path.split(combinedResult)[1])
+        log.info(os.path.split(i)[1] + ' matches ' + str(matched) + ' of ' +
+                 str(matched + len(unmatched)) + ' features in ' +
+                 os.path.split(combinedResult)[1])
+        if unmatched:
+            print('\t\t\tFeatures not matched (IDs):', unmatched[:10],
+                  '...' if len(unmatched) > 10 else '')
+            log.info('\t\t\tFeatures not matched (IDs): ' +
+                     ', '.join(str(oid) for oid in unmatched))
+        else:
+            print('\t\t\tAll features match')
+            log.info('\t\t\tAll features match')
+
+    print('Completed geometry check of input datasets to derived dataset.')
+
+    return results
+
+def describeInput(dataset, referenceDataset=None, expectedEpsg=None):
+    '''
+    Summarise a dataset for the precheck of the inputs (see inputsExist):
+    whether it exists, the feature count, coordinate reference system and
+    extent, and whether the source name fits in the 30 character 'Source'
+    field (and in the field of the dataset where it already has one).
+    Where a reference dataset is given the extent is also projected into
+    its coordinate reference system (see planLevels). arcpy is used where
+    available, otherwise OGR. This is the unit of work run in each process
+    by inputsExist.
+
+    Returns a dictionary of the summary with a list of any problems found.
+
+    Arguments:
+    dataset          -- Dataset to be summarised
+    referenceDataset -- Dataset whose coordinate reference system the
+                        extent is projected into (referenceExtent)
+    expectedEpsg     -- EPSG code the dataset is expected to be in (None
+                        not to check)
+    '''
+    summary = {'dataset': dataset, 'exists': False, 'count': None,
+               'crs': None, 'epsg': None, 'extent': None,
+               'referenceExtent': None, 'problems': []}
+    source = sourceName(dataset)
+    sourceLength = None
+    try:
+        if arcpy:
+            if not arcpy.Exists(dataset):
+                raise IOError('does not exist')
+            describe = arcpy.Describe(dataset)
+            summary['count'] = int(arcpy.GetCount_management(dataset)[0])
+            summary['epsg'] = describe.spatialReference.factoryCode
+            summary['crs'] = '{0} ({1})'.format(
+                describe.spatialReference.name, summary['epsg'])
+            extent = describe.extent
+            summary['extent'] = (extent.XMin, extent.YMin, extent.XMax,
+                                 extent.YMax)
+            if referenceDataset:
+                extent = extent.projectAs(
+                    arcpy.Describe(referenceDataset).spatialReference)
+                summary['referenceExtent'] = (extent.XMin, extent.YMin,
+                                              extent.XMax, extent.YMax)
+            for field in arcpy.ListFields(dataset, 'Source'):
+                sourceLength = field.length
+        else:
+            dataSource, layer = openLayer(dataset)
+            summary['count'] = layer.GetFeatureCount()
+            spatialRef = layer.GetSpatialRef()
+            if spatialRef is not None:
+                code = spatialRef.GetAuthorityCode(None)
+                summary['epsg'] = int(code) if code else None
+                summary['crs'] = '{0} ({1})'.format(spatialRef.GetName(),
+                                                    code)
+            extent = layer.GetExtent()
+            summary['extent'] = (extent[0], extent[2], extent[1], extent[3])
+            if referenceDataset:
+                referenceSource, referenceLayer = openLayer(referenceDataset)
+                extent = projectedExtent(layer,
+                                         layerSpatialRef(referenceLayer))
+                summary['referenceExtent'] = (extent[0], extent[2],
+                                              extent[1], extent[3])
+            layerDefinition = layer.GetLayerDefn()
+            index = layerDefinition.GetFieldIndex('Source')
+            if index >= 0:
+                sourceLength = layerDefinition.GetFieldDefn(index).GetWidth()
+    except Exception as e:
+        summary['problems'].append(str(e) or 'does not exist')
+        return summary
+
+    summary['exists'] = True
+    if not summary['count']:
+        summary['problems'].append('no features')
+    if summary['crs'] is None:
+        summary['problems'].append('no coordinate reference system')
+    elif expectedEpsg and summary['epsg'] != expectedEpsg:
+        summary['problems'].append('coordinate reference system {0}, EPSG:{1}'
+                                   ' expected'.format(summary['crs'],
+                                                      expectedEpsg))
+    if len(source) > 30:
+        summary['problems'].append('source name "{0}" longer than the 30 '
+                                   'character Source field'.format(source))
+    if sourceLength and len(source) > sourceLength:
+        summary['problems'].append('source name "{0}" longer than the '
+                                   'existing Source field ({1})'.format(
+                                       source, sourceLength))
+    return summary
+
+def inputsExist(inputs,combinedResult, workers=None, expectedEpsg=None):
+    '''
+    The inputsExists function tests whether the input datasets exist and
+    can be used in the build. The datasets are opened in parallel in a
+    process pool (see describeInput) and the existence, feature count,
+    coordinate reference system, extent and Source field check of each are
+    reported together, so every problem is found before the build starts.
+    If there are any problems then the script stops. This function uses
+    ArcPy and therefore is capable of testing ESRI Geodatabases. Without
+    arcpy the datasets are opened with OGR (see openLayer).
+
+    Returns the list of summaries, the combined result first, with the
+    extents projected into the coordinate reference system of the combined
+    result (see planLevels).
 
     Arguments
     inputs         -- List of dataset inputs
     combinedResult -- Combined dataset made up of the datasets in the inputs
                         variable.
+    workers        -- Number of processes (default: the number of CPUs)
+    expectedEpsg   -- Dictionary of dataset to the EPSG code it is expected
+                        to be in (see loadManifest)
     '''
-    if not arcpy.Exists(combinedResult):
-        print(combinedResult,'does not exist')
-        log.info('Input file: ' + combinedResult + ' does not exist')
+    datasets = [combinedResult] + list(inputs)
+    expectedEpsg = expectedEpsg or {}
+    print('\nChecking', len(datasets), 'input datasets...')
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(
+            describeInput, datasets, [combinedResult] * len(datasets),
+            [expectedEpsg.get(dataset) for dataset in datasets]))
+
+    problems = 0
+    for summary in summaries:
+        print(summary['dataset'])
+        log.info('Input file: ' + summary['dataset'])
+        if summary['exists']:
+            details = '\t{0} features, {1}, extent {2}'.format(
+                summary['count'], summary['crs'], ', '.join(
+                    '{0:.6g}'.format(value) for value in summary['extent']))
+            print(details)
+            log.info(details)
+        # CRS other than that of the base dataset are projected on the fly
+        if summary['crs'] != summaries[0]['crs'] and summary['exists']:
+            print('\t\tCoordinate reference system differs from ' +
+                  os.path.split(combinedResult)[1])
+            log.info('\t\tCoordinate reference system differs from ' +
+                     os.path.split(combinedResult)[1])
+        for problem in summary['problems']:
+            problems += 1
+            print('\t\tProblem: ' + problem)
+            log.info('\t\tProblem: ' + problem)
+
+    if problems:
+        print(problems, 'problems found with the input datasets. Exit processing')
+        log.info(str(problems) + ' problems found with the input datasets')
         sys.exit()
+    print('\tAll inputs exist')
+    log.info('All inputs exist')
 
-    for i in inputs:
-        print(i)
-        if not arcpy.Exists(i):
-            print(i, ' does not exist')
-            log.info('Input file: ' + i + ' does not exist')
-            sys.exit()
-        else:
+    return summaries
+
+def planLevels(inputs, extents):
+    '''
+    Group the inputs, in priority order, into levels that can be updated
+    together. The order of the update only matters where inputs overlap, so
+    an input is placed in the level after the last level holding an earlier
+    input whose extent overlaps its own; the inputs in a level have disjoint
+    extents, e.g. TAS and WA. Overlapping inputs keep their relative order.
+
+    Returns a list of the levels, each a list of inputs.
+
+    Usage:
+    >>> planLevels(['WA', 'TAS', 'SA'], [(0, 0, 5, 5), (8, 0, 9, 1), (4, 0, 7, 5)])
+    [['WA', 'TAS'], ['SA']]
+
+    Arguments:
+    inputs  -- Ordered list of datasets
+    extents -- (xmin, ymin, xmax, ymax) of each input in a common coordinate
+               reference system (None where unknown, overlapping every
+               other input)
+    '''
+    def overlaps(a, b):
+        return (a is None or b is None or
+                (a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and
+                 b[1] <= a[3]))
+
+    levels = []
+    inputLevels = []
+    for n, extent in enumerate(extents):
+        level = 0
+        for earlier in range(n):
+            if overlaps(extents[earlier], extent):
+                level = max(level, inputLevels[earlier] + 1)
+        inputLevels.append(level)
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(inputs[n])
+    return levels
+
+def loadManifest(manifestFile, pathStub):
+    '''
+    Read the base dataset and the inputs of the build from a JSON manifest:
+
+    {"base": {"path": "AUS_1M/output/AUS_1M_output.gdb/AUS_1M"},
+     "inputs": [{"path": "WA/output/WA_50K.gdb/WA_50K", "priority": 7,
+                 "crs": null, "enabled": true}, ...]}
+
+    Paths are relative to the path stub, separated by '/'. The inputs are
+    updated in ascending priority order so the highest priority input is
+    on top. The crs is the EPSG code each dataset is expected to be in
+    (null not to check, see inputsExist) and inputs that are not enabled
+    are left out of the build. A 'note' can be added to record why.
 
-            print('\tInput exists')
+    Returns the base dataset, the ordered list of the enabled inputs and a
+    dictionary of dataset to expected EPSG code.
+
+    Arguments:
+    manifestFile -- JSON manifest of the build
+    pathStub     -- Common folder the paths are relative to
+    '''
+    with open(manifestFile) as f:
+        manifest = json.load(f)
+
+    def fullPath(entry):
+        return os.path.join(pathStub, *entry['path'].split('/'))
+
+    base = fullPath(manifest['base'])
+    expectedEpsg = {base: manifest['base'].get('crs')}
+    inputs = []
+    for entry in sorted(manifest['inputs'], key=lambda entry: entry['priority']):
+        if not entry.get('enabled', True):
+            print('\tInput disabled: ' + entry['path'] + ' ' +
+                  entry.get('note', ''))
+            log.info('Input disabled: ' + entry['path'] + ' ' +
+                     entry.get('note', ''))
+            continue
+        inputs.append(fullPath(entry))
+        expectedEpsg[inputs[-1]] = entry.get('crs')
+    return base, inputs, expectedEpsg
 
 #==============================================================================
 # Mainline
@@ -318,10 +1545,61 @@ if __name__ == '__main__':
     # unit tests
 #    unittest.main()
     t0 = time.time()
+    # Build options, the GDAL backend is used where arcpy is not available
+    parser = argparse.ArgumentParser(description='Build the national dataset'
+                                     ' from the state datasets')
+    parser.add_argument('--backend', choices=['arcpy', 'gdal'],
+                        default='arcpy' if arcpy else 'gdal',
+                        help='Update_analysis (arcpy) or GDAL/OGR and '
+                        'Shapely, tile by tile in parallel (gdal)')
+    parser.add_argument('--tiled', dest='backend', action='store_const',
+                        const='gdal', help='Same as --backend gdal')
+    parser.add_argument('--tiles', type=int, default=10,
+                        help='Number of tiles along each side of the grid '
+                        '(default: 10)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Run every step rather than resuming from the '
+                        'last unchanged checkpoint')
+    parser.add_argument('--intermediates', choices=['memory', 'scratch'],
+                        default=None,
+                        help='Write the steps that are not kept to memory or '
+                        'the scratch geodatabase (default: the geodatabase)')
+    parser.add_argument('--keep', type=int, default=None,
+                        help='Number of steps before the final dataset kept '
+                        'in the geodatabase as checkpoints (default: all)')
+    parser.add_argument('--grid-size', type=float, default=None,
+                        help='Precision grid (XY resolution) of the overlay '
+                        'in the units of the base dataset (default: full '
+                        'precision)')
+    parser.add_argument('--snap', type=float, default=None,
+                        help='Snap tolerance (XY tolerance) of the overlay in '
+                        'the units of the base dataset (default: none)')
+    parser.add_argument('--manifest', default=os.path.join(os.path.dirname(
+                        os.path.abspath(sys.argv[0])), 'buildNationalDataset.json'),
+                        help='JSON manifest of the base dataset and inputs '
+                        '(default: buildNationalDataset.json beside the script)')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Update the inputs one at a time rather than '
+                        'together where their extents are disjoint')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of processes (default: number of CPUs)')
+    parser.add_argument('--allow-partial', action='store_true',
+                        help='Write the output of the GDAL backend without '
+                        'the tiles that failed (default: exit without output)')
+    args = parser.parse_args()
+    tiled = args.backend == 'gdal'
+    if tiled and (ogr is None or shapely is None):
+        print('The GDAL backend requires GDAL/OGR and Shapely. Exit processing')
+        sys.exit()
+    if not tiled and (arcpy is None or shapely is None):
+        print('The arcpy backend requires arcpy and Shapely (for the geometry '
+              'check). Exit processing')
+        sys.exit()
+
     # User input to change the workspace
     pathStub = input('Provide the common folder path stub that ends in "\PRODUCTION":' )
 
-    workspace = (os.path.join(os.path.split(pathStub)[0], r'working\buildNationalDataset'))
+    workspace = (os.path.join(os.path.split(pathStub)[0], 'working', 'buildNationalDataset'))
 
     os.path.exists(workspace)
     if not os.path.exists(workspace):
@@ -358,41 +1636,81 @@ if __name__ == '__main__':
 #    assert os.path.exists(logfile)
     # Log the workspace to the logfile
     log.info('Workspace: ' + workspace)
+    # The timing and resource use of each stage is written next to the log
+    # file as the stage completes
+    startProfile(os.path.splitext(logfile)[0] + '_profile.csv')
 
 
-    inputs = [os.path.join(pathStub, r'VIC\output\VIC_250K.gdb\VIC_250K_geol'),
-              #os.path.join(pathStub, r'NT\output\NT_250K_output.gdb\NT_250K'), # Left out due to 600 m displacement of features to equivalent in 1:100k data
-              os.path.join(pathStub, r'NT\output\NT_100K_output.gdb\NT_100K'),
-              os.path.join(pathStub, r'QLD\output\QLD_100K_output.gdb\QLD_100K'),
-              os.path.join(pathStub, r'SA\SA_test.gdb\SA_test_NoNULLS'),
-              os.path.join(pathStub, r'NSW\output\NSW_z56_output.gdb\NSW_z56_output_GDA94'),
-              os.path.join(pathStub, r'VIC\output\VIC_50K.gdb\VIC_50K_geol'),
-              os.path.join(pathStub, r'WA\output\WA_50K.gdb\WA_50K'),
-              os.path.join(pathStub, r'TAS\output\TAS_25K_output.gdb\tas_25k')]
-
-    national1MReclass = os.path.join(pathStub, r'AUS_1M\output\AUS_1M_output.gdb\AUS_1M')
-    gdb = os.path.join(os.path.split(pathStub)[0], r'working\buildNationalDataset\buildNationalDataset.gdb')
+    # The base dataset and the inputs, in priority order, from the manifest
+    log.info('Manifest: ' + args.manifest)
+    shutil.copy2(args.manifest, os.path.join(workspace, os.path.splitext(
+        os.path.split(args.manifest)[1])[0] + '_' + versionStub + '.json'))
+    national1MReclass, inputs, expectedEpsg = loadManifest(args.manifest,
+                                                           pathStub)
+    gdb = os.path.join(workspace, 'buildNationalDataset.gdb')
+    if tiled:
+        gdb = os.path.join(workspace, 'buildNationalDataset.gpkg')
     log.info('Data to be stored in: ' + gdb)
+    log.info('Grid size: {0}, snap tolerance: {1}'.format(args.grid_size,
+                                                          args.snap))
     # Check that the inputs exist
-    inputsExist(inputs, national1MReclass)
-
-    # Run the spatialJoin function to see whether the geometry matches the source and derived data
-    outputDataset = buildNational(inputs, national1MReclass, gdb)
-
-    #Run a second spatial join of source data to result to check the number
-    #  of rows matched
-    print('\nChecking spatial join of inputs in reverse order of being updated',
-        'into the combined dataset')
-    log.info('Checking spatial join of inputs in reverse order of being updated'
-        'into the combined dataset')
-    # Reverse the order in the list
-    inputs.reverse()
-    # Run the spatial join in reverse list order to compare against earlier spatial join as captured
-    #  in the log file.
-    for i in inputs:
-        spatialJoin(i, outputDataset)
-    print('Completed final spatial join checks')
-    log.info('Completed final spatial join checks')
+    with profileStage('precheck', '{0} inputs'.format(len(inputs) + 1)):
+        summaries = inputsExist(inputs, national1MReclass, args.workers,
+                                expectedEpsg)
+
+    # Group the inputs whose extents are disjoint to be updated together
+    if args.sequential:
+        levels = [[i] for i in inputs]
+    else:
+        levels = planLevels(inputs, [summary['referenceExtent']
+                                     for summary in summaries[1:]])
+    for n, level in enumerate(levels, 1):
+        print('\tStep', n, ':', ', '.join(os.path.split(i)[1] for i in level))
+        log.info('Step {0}: {1}'.format(n, ', '.join(level)))
+
+    if tiled:
+        # Build tile by tile in parallel with GDAL/OGR and Shapely
+        log.info('Tiled build: {0} x {0} tiles'.format(args.tiles))
+        try:
+            outputDataset = buildNationalTiled(levels, national1MReclass, gdb,
+                                               args.tiles, args.workers,
+                                               args.grid_size, args.snap,
+                                               args.allow_partial)
+        except RuntimeError as e:
+            print(str(e) + '. Exit processing')
+            log.error(str(e) + '. Exit processing')
+            sys.exit(1)
+        # Check the geometry of the inputs, in reverse order, in the result
+        inputs.reverse()
+        with profileStage('verify', 'all inputs', inputs + [outputDataset]):
+            verifyGeometry(inputs, outputDataset)
+    else:
+        # Checkpoints of the intermediate datasets so a rerun only repeats
+        # the steps from the first changed input
+        checkpointFile = os.path.join(workspace, 'buildNationalDataset_checkpoints.json')
+        if args.rebuild and os.path.exists(checkpointFile):
+            os.remove(checkpointFile)
+        log.info('Checkpoints: ' + checkpointFile)
+        log.info('Intermediates: {0}, steps kept: {1}'.format(
+            args.intermediates, args.keep))
+        outputDataset = buildNational(levels, national1MReclass, gdb,
+                                      checkpointFile, args.intermediates,
+                                      args.keep, args.grid_size, args.snap)
+
+        #Run a second geometry check of source data to result to check the
+        #  number of features matched
+        print('\nChecking geometry of inputs in reverse order of being updated',
+            'into the combined dataset')
+        log.info('Checking geometry of inputs in reverse order of being updated'
+            'into the combined dataset')
+        # Reverse the order in the list
+        inputs.reverse()
+        # Run the check in reverse list order to compare against earlier checks
+        #  as captured in the log file. The result is only hashed once.
+        with profileStage('verify', 'all inputs', inputs + [outputDataset]):
+            verifyGeometry(inputs, outputDataset)
+        print('Completed final geometry checks')
+        log.info('Completed final geometry checks')
 
 
     # Print the duration of the script to screen and capture in the log file
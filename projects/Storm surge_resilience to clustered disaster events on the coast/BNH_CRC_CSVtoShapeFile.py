@@ -7,6 +7,10 @@ Description:
     Bushfire and Natural Hazards CRC project 'Storm surge:
     resilience to clustered disaster events on the coast'
 
+    The shorelines can be written as polygons, lines or both from a single
+    pass over the CSV (see Write_Dict_To_Shapefile_osgeo). This script is
+    also the conversion engine of BNH_CRC_CSVtoShapeFileLine.py.
+
     Quality assurance to include:
         - via ArcGIS, check that the data plots in the right location relative
           to other date for the location (coordinate reference system check)
@@ -15,6 +19,11 @@ Description:
         - manual check in ArcGIS to edit a polygon and confirm the number of
           vertices and the X/Y values are correct
 
+    The vertex count, feature count and coordinate reference system (area
+    of use) checks, plus closed ring and self-intersection checks, are run
+    automatically during the conversion (see shorelineProblems and
+    qaReport) with any problems written to the log file.
+
 
 
 @author: Duncan Moore - Geoscience Australia November 2016
@@ -33,9 +42,14 @@ import zipfile
 import doctest
 import unittest
 import csv
+import struct
+import mmap
+import tempfile
 import collections
+import argparse
+import glob
+import numpy as np
 from osgeo import gdal, ogr, osr
-import inspect
 import shutil
 
 ## Check out any necessary licenses
@@ -47,6 +61,12 @@ import shutil
 #==============================================================================
 # Classes
 #==============================================================================
+# A shoreline drawn from an X row and the Y row that follows it in the CSV.
+# The two header cells of the X row are split out (label and 'date time') and
+# the vertices are held as contiguous float64 arrays rather than a dictionary
+# of strings, which would also collapse duplicate X coordinates.
+Shoreline = collections.namedtuple('Shoreline', ['label', 'dateTime', 'x', 'y'])
+
 class TestTimer(unittest.TestCase):
 
     def test_timer(self):
@@ -55,21 +75,60 @@ class TestTimer(unittest.TestCase):
                          '24 minutes, 0 seconds')
 
 
+# Verbosity of logAndprint. INFO reports progress and summaries, DEBUG adds a
+# message per feature and TRACE a message per vertex.
+TRACE = 5
+log.addLevelName(TRACE, 'TRACE')
+verbosity = log.INFO
+
+# OGR geometry type of each shoreline output ('both' writes one of each)
+geometryTypes = {'polygon': ogr.wkbPolygon, 'line': ogr.wkbLineString}
+
+# Output formats supported by Write_Dict_To_Shapefile_osgeo, OGR driver name
+# and file extension. GeoPackage and FlatGeobuf are not subject to the 2 GB
+# shapefile limit and cope better with large feature counts.
+outputDrivers = collections.OrderedDict([('ESRI Shapefile', '.shp'),
+                                         ('GPKG', '.gpkg'),
+                                         ('FlatGeobuf', '.fgb')])
+
+# Layer creation options building the spatial index as the layer is written
+# (an R-tree for GeoPackage, a packed Hilbert R-tree for FlatGeobuf). These
+# are the driver defaults but are set so the index is never dropped. The
+# shapefile .qix index is built once the features are written (see
+# createSpatialIndex).
+spatialIndexOptions = {'ESRI Shapefile': [],
+                       'GPKG': ['SPATIAL_INDEX=YES'],
+                       'FlatGeobuf': ['SPATIAL_INDEX=YES']}
+
 #==============================================================================
 # Functions
 #==============================================================================
 
-def logAndprint(msg):
+def logAndprint(msg, *args, **kwargs):
     '''
-    Print the message to the console and also to the log file at the 'info'
-    level.
+    Print the message to the console and also to the log file. Messages
+    below the verbosity level are dropped before any formatting is done, so
+    the per-feature (DEBUG) and per-vertex (TRACE) calls in the writer cost
+    little more than a comparison when tracing is off.
 
     Arguments
-    message -- Value to be written to the console and to the log file
+    message -- Value to be written to the console and to the log file. When
+               args are supplied it is a str.format template for them.
+    args    -- Values formatted into the message (only if it is written)
+    level   -- Keyword argument, logging level of the message (default INFO)
     '''
-    print msg
-    log.info(' Line: ' + str(inspect.currentframe().f_back.f_lineno) +
-        ' :: ' + msg)
+    level = kwargs.get('level', log.INFO)
+    if level < verbosity:
+        return
+    if args:
+        msg = msg.format(*args)
+    print(msg)
+    if sys.version_info >= (3, 8):
+        # The log record takes its line number from the caller
+        log.log(level, msg, stacklevel=2)
+    else:
+        log.log(level, ' Line: ' + str(sys._getframe(1).f_lineno) + ' :: ' +
+                msg)
 
     return
 
@@ -154,21 +213,21 @@ def zipArchive(workspace, script, logg):
 
     zipFILE = os.path.join(workspace, r'zipFile_' + versionStub + '.zip')
 #    log.info('Empty Zipfile being created: ' + zipFILE)
-    logAndprint('\nEmpty Zipfile being created: ', zipFILE)
+    logAndprint('\nEmpty Zipfile being created: {0}', zipFILE)
     with zipfile.ZipFile(zipFILE, 'w') as zf:
 #    zf = zipfile.ZipFile(zipFILE, 'w')
         logAndprint('\tzipping workspace')
        # Write the contents of the file geodatabase to the zip file. Note that
        # this requires the full path to the file, not just the file name (f)
         for f in os.listdir(workspace):
-            logAndprint('\t\t',f)
+            logAndprint('\t\t{0}', f)
             if f == os.path.split(zipFILE)[1]:
                 logAndprint('\t\t\tSkipped adding new Zip contents to Zip file')
             elif f == os.path.split(logg)[1]:
                 logAndprint('\t\t\tSkipped adding logfile - still being written to')
             elif not f.endswith('.lock'):
                 zf.write(os.path.join(workspace,f))
-                logAndprint('\t\t\tWritten:', f)
+                logAndprint('\t\t\tWritten: {0}', f)
         logAndprint('\tzipping script')
         zf.write(os.path.split(script)[1])
         log.info(os.path.split(script)[1] +
@@ -184,44 +243,130 @@ def zipArchive(workspace, script, logg):
 
     return
 
-def Write_Dict_To_Shapefile_osgeo(totalList, shapefileName, EPSG):
+def openCsv(csvPath):
     '''
-    Adapted from
-    https://github.com/GeoscienceAustralia/LidarProcessingScripts/RasterIndexTool_GDAL.py
-    This function takes a list of dictionaries where each row in the list
-    is a feature consisting of the X/Y geometries in the dictionary for each
-    item in the list.
+    Open a CSV for the csv module, i.e. in binary mode in Python 2 and as
+    text without newline translation in Python 3.
 
     Arguments:
-    totalList     -- List of dictionaries
-    shapefileName -- Name of the shapefile to be created/overwritten
+    csvPath -- Path to the CSV file
+    '''
+    if sys.version_info.major == 2:
+        return open(csvPath, 'rb')
 
+    return open(csvPath, 'r', newline='')
 
+def shorelineArrays(keys, values):
     '''
-    gdal.UseExceptions()
+    Convert an X row and its matching Y row from the CSV into a Shoreline.
+    The first two cells of each row are header cells, the remaining cells are
+    parsed straight into float64 arrays and validated as a whole, i.e. both
+    rows must hold the same number of finite coordinates.
 
-    shapePath = os.path.join(workspace,shapefileName)
+    Arguments:
+    keys   -- X row from the CSV (label, 'YYYY/MM/DD HH:MM', X1, X2, ...)
+    values -- Y row from the CSV (two header cells, Y1, Y2, ...)
+    '''
+    x = np.array(keys[2:], dtype=np.float64)
+    y = np.array(values[2:], dtype=np.float64)
 
-    # Get driver
-    driver = ogr.GetDriverByName('ESRI Shapefile')
+    return validateShoreline(Shoreline(keys[0], keys[1], x, y))
+
+def validateShoreline(record):
+    '''
+    Check the vertex arrays of a Shoreline as a whole: the X and Y arrays
+    must be the same length and hold only finite values. Returns the record
+    unchanged, raises ValueError otherwise.
+
+    Arguments:
+    record -- Shoreline to be checked
+    '''
+    if record.x.shape != record.y.shape:
+        raise ValueError('{0} X values do not match {1} Y values for {2}'
+                         .format(record.x.size, record.y.size,
+                                 record.dateTime))
+    if not (np.isfinite(record.x).all() and np.isfinite(record.y).all()):
+        raise ValueError('Non-finite coordinate found for ' + record.dateTime)
+
+    return record
+
+def parseCoordinates(cells, dateTime):
+    '''
+    Convert the comma separated numeric cells of a CSV row to a float64
+    array with a single numpy call. numpy stops at the first cell that is
+    not a number, so the result is checked against the number of cells.
+
+    Arguments:
+    cells    -- Numeric part of the row (bytes), e.g. b'1.5,2.5,3.5'
+    dateTime -- Date/time of the shoreline (for the error message)
+    '''
+    values = np.fromstring(cells, dtype=np.float64, sep=',')
+    if values.size != cells.count(b',') + 1:
+        raise ValueError('Non-numeric coordinate found for ' + dateTime)
+
+    return values
 
+def shorelineWkb(x, y, geomType=ogr.wkbPolygon):
+    '''
+    Encode the X/Y vertex arrays of a shoreline as (little endian) WKB in one
+    step so the geometry can be created with a single
+    ogr.CreateGeometryFromWkb call rather than a call per vertex. Polygon
+    rings are closed by repeating the first vertex where the CSV does not
+    already close them.
+
+    Arguments:
+    x, y     -- float64 arrays of the shoreline vertices
+    geomType -- ogr.wkbPolygon or ogr.wkbLineString
+    '''
+    if geomType == ogr.wkbPolygon and x.size and (x[0] != x[-1] or
+                                                  y[0] != y[-1]):
+        x = np.append(x, x[0])
+        y = np.append(y, y[0])
+    coords = np.empty((x.size, 2), dtype='<f8')
+    coords[:, 0] = x
+    coords[:, 1] = y
+    if geomType == ogr.wkbPolygon:
+        # byte order, type, number of rings, number of points in the ring
+        header = struct.pack('<BIII', 1, ogr.wkbPolygon, 1, x.size)
+    else:
+        # byte order, type, number of points
+        header = struct.pack('<BII', 1, ogr.wkbLineString, x.size)
+
+    return header + coords.tobytes()
+
+def createShorelineLayer(shapePath, driver, EPSG, geomType):
+    '''
+    Create (overwriting if it exists) the output data source and a layer with
+    the 'Date' and 'Time' fields for the shorelines.
+
+    Returns the data source and the layer.
+
+    Arguments:
+    shapePath -- Path of the output to be created/overwritten
+    driver    -- OGR driver of the output
+    EPSG      -- EPSG code of the coordinate reference system of the X/Y
+                 values
+    geomType  -- ogr.wkbPolygon or ogr.wkbLineString
+    '''
     # Create shapeData, overwrite the data if it exists
-    os.chdir(workspace)
-    if os.path.exists(shapefileName):
-        print 'Shapefile exists and will be deleted'
+    if os.path.exists(shapePath):
+        print('Shapefile exists and will be deleted')
         driver.DeleteDataSource(shapePath)
         assert not os.path.exists(shapePath)
 
-    shapeData = driver.CreateDataSource(shapefileName)
+    shapeData = driver.CreateDataSource(shapePath)
 
     # Create spatialReference for output
     outputspatialRef = osr.SpatialReference()
 
-    # Set coordinate reference system to GDA94/MGA zone 56
+    # Set coordinate reference system, e.g. 28356 = GDA94/MGA zone 56
     outputspatialRef.ImportFromEPSG(EPSG)
 
-    # Create layer
-    layer = shapeData.CreateLayer(shapePath, srs=outputspatialRef, geom_type=ogr.wkbPolygon)
+    # Create layer, named after the output file (a path is not a valid
+    # GeoPackage layer name)
+    layerName = os.path.splitext(os.path.split(shapePath)[1])[0]
+    layer = shapeData.CreateLayer(layerName, srs=outputspatialRef, geom_type=geomType,
+                                  options=spatialIndexOptions[driver.GetName()])
 
     # add fields
     fieldNames = ["Date", "Time"]
@@ -235,89 +380,200 @@ def Write_Dict_To_Shapefile_osgeo(totalList, shapefileName, EPSG):
             field_name.SetWidth(24)
             layer.CreateField(field_name)
 
-    # Create polyline object
-    ring = ogr.Geometry(ogr.wkbLinearRing)
-    count = 0
-    for entry in totalList:
-        logAndprint( 'Row {0} being processed'.format(count))
-        dictCounter = 0
-#        while dictCounter < 10:
-        logAndprint('Dictionary count {0}'.format(len(totalList[count])))
-        for key, value in totalList[count].iteritems():
-            logAndprint('\n{0} row, {1} vertex being created'.format(count, dictCounter))
-            logAndprint('\tKey: {0}, value: {1}'.format(key, value))
-    #        print count
-            if dictCounter < 2:
-                logAndprint('\tRow passed')
-                pass
-                dictCounter += 1
+    return shapeData, layer
 
-            else:
-                ring.AddPoint(float(key), float(value))
-                logAndprint('\t\t{0} and {1} vertex added to ring'.format(key,value))
-                dictCounter += 1
+def createSpatialIndex(shapeData, layer):
+    '''
+    Build the quadtree spatial index (.qix) of a shapefile layer so bounding
+    box queries (see queryShorelines) read only the candidate features
+    rather than scanning the whole file. GeoPackage and FlatGeobuf outputs
+    build their index as they are written (see spatialIndexOptions).
+
+    Arguments:
+    shapeData -- Shapefile data source, open for writing
+    layer     -- Layer of the data source to be indexed
+    '''
+    layer.SyncToDisk()
+    shapeData.ExecuteSQL('CREATE SPATIAL INDEX ON "{0}"'.format(layer.GetName()))
+    logAndprint('Spatial index created for {0}', layer.GetName(),
+                level=log.DEBUG)
+
+def queryShorelines(shapePath, bbox):
+    '''
+    Find the shorelines in an output that intersect a bounding box, e.g. a
+    coastal cell. The lookup uses the spatial index of the output (.qix,
+    GeoPackage R-tree or FlatGeobuf index) so only the features near the
+    box are read.
+
+    Returns a list of (FID, Date, Time) tuples of the shorelines found.
 
-        poly = ogr.Geometry(ogr.wkbPolygon)
-        logAndprint('Adding geometry')
-        poly.AddGeometry(ring)
+    Arguments:
+    shapePath -- Path of the output written by Write_Dict_To_Shapefile_osgeo
+    bbox      -- (xmin, ymin, xmax, ymax) in the coordinate reference system
+                 of the output
+    '''
+    gdal.UseExceptions()
+    shapeData = ogr.Open(shapePath)
+    layer = shapeData.GetLayer(0)
+    layer.SetSpatialFilterRect(*bbox)
 
-        # Create feature
-        layerDefinition = layer.GetLayerDefn()
-        feature = ogr.Feature(layerDefinition)
-        feature.SetGeometry(poly)
-        # Set the FID field to the count
-        feature.SetFID(count)
+    shorelines = [(feature.GetFID(), feature.GetField('Date'),
+                   feature.GetField('Time')) for feature in layer]
+
+    layer = None
+    shapeData = None
+    return shorelines
+
+def Write_Dict_To_Shapefile_osgeo(totalList, shapefileName, EPSG,
+                                  driverName='ESRI Shapefile', batchSize=1000,
+                                  outFolder=None, geometryType='polygon'):
+    '''
+    Adapted from
+    https://github.com/GeoscienceAustralia/LidarProcessingScripts/RasterIndexTool_GDAL.py
+    This function takes a list of Shoreline records (see shorelineArrays)
+    where each item in the list is a feature made up of the X/Y vertex
+    arrays and the date/time of the shoreline. Any iterable of Shoreline
+    records can be supplied, e.g. the csvStreaming generator, in which case
+    each feature is written as it is read from the CSV.
+
+    The shorelines are written as polygons, lines or both. When both are
+    written they come from the same pass over the records; the lines go to
+    an output named after shapefileName with a '_line' suffix. Each output
+    is spatially indexed (see createSpatialIndex and queryShorelines).
+
+    Returns the list of output paths.
+
+    Arguments:
+    totalList     -- List (or other iterable) of Shoreline records
+    shapefileName -- Name of the shapefile to be created/overwritten
+    EPSG          -- EPSG code of the coordinate reference system of the X/Y
+                     values
+    driverName    -- OGR driver of the output, one of the outputDrivers keys
+                     (the shapefileName extension should match)
+    batchSize     -- Number of features written per transaction where the
+                     driver supports transactions (GeoPackage). 0 writes
+                     without transactions.
+    outFolder     -- Folder the output is written to (default: workspace)
+    geometryType  -- 'polygon', 'line' or 'both'
+
+
+    '''
+    gdal.UseExceptions()
+
+    if outFolder is None:
+        outFolder = workspace
+
+    # Get driver
+    assert driverName in outputDrivers
+    driver = ogr.GetDriverByName(driverName)
+
+    # Output name and OGR geometry type of each output
+    if geometryType == 'both':
+        outputs = [(shapefileName, ogr.wkbPolygon),
+                   (os.path.splitext(shapefileName)[0] + '_line' +
+                    outputDrivers[driverName], ogr.wkbLineString)]
+    else:
+        outputs = [(shapefileName, geometryTypes[geometryType])]
+
+    shapePaths = []
+    writers = []
+    for outputName, geomType in outputs:
+        shapePath = os.path.join(outFolder, outputName)
+        shapeData, layer = createShorelineLayer(shapePath, driver, EPSG,
+                                                geomType)
+        # The feature definition is shared by every feature in the layer
+        writers.append((shapeData, layer, layer.GetLayerDefn(), geomType))
+        shapePaths.append(shapePath)
+
+    # Commit the features in batches where the driver supports transactions,
+    # otherwise each CreateFeature is written straight through
+    transactions = (batchSize > 0 and
+                    writers[0][0].TestCapability(ogr.ODsCTransactions))
+    if transactions:
+        for writer in writers:
+            writer[0].StartTransaction()
+
+    count = 0
+    for entry in totalList:
+        logAndprint('Row {0} being processed', count, level=log.DEBUG)
+        logAndprint('Vertex count {0}', len(entry.x), level=log.DEBUG)
+        if verbosity <= TRACE:
+            for vertex in range(len(entry.x)):
+                logAndprint('\t\t{0} row, {1} vertex: {2}, {3}', count, vertex,
+                            entry.x[vertex], entry.y[vertex], level=TRACE)
 
         # Calculate fields
-        logAndprint('Calculating "Date" & "Time" fields')
+        logAndprint('Calculating "Date" & "Time" fields', level=log.DEBUG)
 
         # Date is supplied in YYYY/MM/DD
-        date = str(totalList[count].keys()[1].split()[0])
+        date = entry.dateTime.split()[0]
         # For animation in ArcGIS the date needs to be in the form
         # DD/MM/YYYY
         reformattedDate = (date.split('/')[2] + '/' + date.split('/')[1] + '/' + date.split('/')[0])
-        logAndprint('reformatted date:' + reformattedDate)
-        feature.SetField('Date',str(reformattedDate))
-        feature.SetField('Time',str(totalList[count].keys()[1].split()[1]))
+        logAndprint('reformatted date: {0}', reformattedDate, level=log.DEBUG)
+
+        for shapeData, layer, layerDefinition, geomType in writers:
+            # Build the polygon/polyline from all of the vertices at once
+            geometry = ogr.CreateGeometryFromWkb(
+                shorelineWkb(entry.x, entry.y, geomType))
 
-        # Save feature
-        layer.CreateFeature(feature)
+            # Create feature
+            feature = ogr.Feature(layerDefinition)
+            feature.SetGeometry(geometry)
+            # Set the FID field to the count. GeoPackage and FlatGeobuf assign
+            # their own FIDs (GeoPackage FIDs start at 1)
+            if driverName == 'ESRI Shapefile':
+                feature.SetFID(count)
 
-        logAndprint('{0} rows processed'.format(count))
+            feature.SetField('Date',str(reformattedDate))
+            feature.SetField('Time',str(entry.dateTime.split()[1]))
+
+            # Save feature
+            layer.CreateFeature(feature)
+
+        logAndprint('{0} rows processed', count, level=log.DEBUG)
         count += 1
 
-        # Empty the ring otherwise the vertices are accumulatied
-        ring.Empty()
+        if transactions and count % batchSize == 0:
+            for writer in writers:
+                writer[0].CommitTransaction()
+                writer[0].StartTransaction()
+            logAndprint('{0} features committed', count)
 
+    if transactions:
+        for writer in writers:
+            writer[0].CommitTransaction()
 
-    # Cleanup
-    poly.Destroy()
-    feature.Destroy()
+    # Index shapefiles once all of the features are written
+    if driverName == 'ESRI Shapefile':
+        for writer in writers:
+            createSpatialIndex(writer[0], writer[1])
 
     # Cleanup
-    shapeData.Destroy()
+    for writer in writers:
+        writer[0].Destroy()
     # Return
-    return shapePath
+    return shapePaths
 
 def csvProcessing():
     '''
-    Process the CSV file into a list of dictionaries. Each item in the list
-    contains the dictionary that is made up of key/values that are drawn from
-    two rows in the CSV file.
+    Process the CSV file into a list of Shoreline records. Each item in the
+    list holds the X/Y vertex arrays that are drawn from two rows in the CSV
+    file (see shorelineArrays).
 
     '''
     count = 0
-    with open(shoreline, 'rb') as csvfile:
+    with openCsv(shoreline) as csvfile:
 #        print shoreline.name
         rowReader = csv.reader(csvfile, delimiter=',', quotechar='|')
         for row in rowReader:
-            logAndprint('Row {0} being processed'.format(count))
-            # For every second row, but not including row 0, create a dict
-            # of the X/Y pairs from odd/even rows respectively
+            logAndprint('Row {0} being processed', count, level=log.DEBUG)
+            # For every second row, but not including row 0, create the
+            # X/Y arrays from odd/even rows respectively
             if count % 2 == 0 and count != 0:
                 values = list(row)
-                dictionary = collections.OrderedDict(zip(keys,values))
-                totalList.append(dictionary)
+                record = shorelineArrays(keys, values)
+                totalList.append(record)
                 del values
                 del keys
     #                if count == 2:
@@ -327,13 +583,456 @@ def csvProcessing():
                 # if odd row number then create the list of X keys
                 keys = list(row)
             if count == 2:
-#                logAndprint(dictionary)
-                logAndprint('Dictionary length: ' + str(len(dictionary)))
+#                logAndprint(record)
+                logAndprint('Vertex count: {0}', len(record.x))
 
             count += 1
 
     return
 
+def csvStreaming(shoreline):
+    '''
+    Generator alternative to csvProcessing. Rather than building the whole CSV
+    into the global totalList, the X row and Y row of each shoreline are
+    paired and yielded as a single Shoreline record. Passing the generator to
+    Write_Dict_To_Shapefile_osgeo writes each feature as soon as it is read,
+    so memory use stays flat regardless of the size of the CSV.
+
+    Arguments:
+    shoreline -- Path to the CSV file to be processed
+    '''
+    with openCsv(shoreline) as csvfile:
+        rowReader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        # Row 0 is not part of an X/Y pair (see csvProcessing)
+        next(rowReader, None)
+        count = 0
+        for keys in rowReader:
+            # The Y values are on the row following the X keys
+            values = next(rowReader, None)
+            if values is None:
+                logAndprint('X row without a matching Y row skipped')
+                break
+            count += 1
+            yield shorelineArrays(keys, values)
+
+    logAndprint('{0} X/Y row pairs streamed', count)
+
+def csvMemoryMapped(shoreline):
+    '''
+    Faster alternative to csvStreaming for the (purely numeric) shoreline
+    CSVs. The file is memory mapped and each row is split once into its two
+    header cells and the numeric remainder, which is converted to an array
+    in a single call (see parseCoordinates) rather than a float() per cell.
+    Yields the same Shoreline records as csvStreaming. Quoted cells are not
+    supported.
+
+    Arguments:
+    shoreline -- Path to the CSV file to be processed
+    '''
+    count = 0
+    with open(shoreline, 'rb') as csvfile:
+        # An empty file can not be mapped
+        if os.fstat(csvfile.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            rows = iter(mapped.readline, b'')
+            # Row 0 is not part of an X/Y pair (see csvProcessing)
+            next(rows, None)
+            for xRow in rows:
+                # The Y values are on the row following the X keys
+                yRow = next(rows, None)
+                if yRow is None:
+                    logAndprint('X row without a matching Y row skipped')
+                    break
+                label, dateTime, xCells = xRow.rstrip(b'\r\n').split(b',', 2)
+                yCells = yRow.rstrip(b'\r\n').split(b',', 2)[2]
+                dateTime = dateTime.decode('ascii')
+                count += 1
+                yield validateShoreline(Shoreline(
+                    label.decode('ascii'), dateTime,
+                    parseCoordinates(xCells, dateTime),
+                    parseCoordinates(yCells, dateTime)))
+        finally:
+            mapped.close()
+
+    logAndprint('{0} X/Y row pairs streamed', count)
+
+# Readers that yield Shoreline records from a CSV, selected by name
+csvReaders = {'csv': csvStreaming, 'mmap': csvMemoryMapped}
+
+def benchmarkIngestion(vertices=1000000, verticesPerShoreline=160):
+    '''
+    Time csvProcessing, csvStreaming and csvMemoryMapped reading the same
+    synthetic CSV of (roughly) the given number of vertices. The timings are
+    printed/logged and returned as a dictionary of seconds.
+
+    Usage:
+    > benchmarkIngestion()
+
+    Arguments:
+    vertices             -- Total number of vertices in the synthetic CSV
+    verticesPerShoreline -- Vertices in each shoreline (X/Y row pair)
+    '''
+    global shoreline, totalList
+
+    rng = np.random.RandomState(0)
+    handle, shoreline = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w') as csvfile:
+        csvfile.write('Shorelines\n')
+        for n in range(vertices // verticesPerShoreline):
+            coords = rng.uniform(0, 1000, (2, verticesPerShoreline))
+            csvfile.write('{0},2016/01/01 {1:02d}:00,'.format(n, n % 24) +
+                          ','.join(repr(float(v)) for v in coords[0] + 300000) +
+                          '\n')
+            csvfile.write('{0},,'.format(n) +
+                          ','.join(repr(float(v)) for v in coords[1] + 6900000) +
+                          '\n')
+
+    timings = collections.OrderedDict()
+    try:
+        t0 = time.time()
+        totalList = []
+        csvProcessing()
+        timings['csvProcessing'] = time.time() - t0
+        for name in ['csv', 'mmap']:
+            t0 = time.time()
+            for record in csvReaders[name](shoreline):
+                pass
+            timings[csvReaders[name].__name__] = time.time() - t0
+    finally:
+        totalList = []
+        os.remove(shoreline)
+
+    for name, seconds in timings.items():
+        logAndprint('{0:<16} {1:>8.2f} seconds, {2:>10.0f} vertices/second',
+                    name, seconds, vertices / seconds)
+
+    return timings
+
+def areaOfUseBounds(EPSG):
+    '''
+    Bounding box (xmin, ymin, xmax, ymax), in the coordinates of the EPSG
+    coordinate reference system, of the area the CRS is valid for. The
+    longitude/latitude area of use is densified before it is projected as
+    its edges are curved in projected coordinates. Returns None if GDAL
+    does not provide the area of use (GDAL < 3).
+
+    Arguments:
+    EPSG -- EPSG code of the coordinate reference system
+    '''
+    spatialRef = osr.SpatialReference()
+    spatialRef.ImportFromEPSG(EPSG)
+    area = spatialRef.GetAreaOfUse() if hasattr(spatialRef, 'GetAreaOfUse') else None
+    if area is None:
+        return None
+
+    geographic = osr.SpatialReference()
+    geographic.ImportFromEPSG(4326)
+    # Keep X/Y (longitude/latitude) axis order with GDAL 3
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        geographic.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        spatialRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(geographic, spatialRef)
+
+    lon = np.linspace(area.west_lon_degree, area.east_lon_degree, 21)
+    lat = np.linspace(area.south_lat_degree, area.north_lat_degree, 21)
+    edges = ([(x, lat[0]) for x in lon] + [(x, lat[-1]) for x in lon] +
+             [(lon[0], y) for y in lat] + [(lon[-1], y) for y in lat])
+    projected = np.array(transform.TransformPoints(edges))[:, :2]
+    projected = projected[np.isfinite(projected).all(axis=1)]
+
+    return (projected[:, 0].min(), projected[:, 1].min(),
+            projected[:, 0].max(), projected[:, 1].max())
+
+def selfIntersections(vertices, closed=True):
+    '''
+    Count the pairs of non-adjacent segments that cross each other, testing
+    every pair at once with numpy (a 160 vertex shoreline is ~13,000 pairs).
+    Segments that only touch or overlap along a line are not counted.
+
+    Arguments:
+    vertices -- (n, 2) array of the vertices in order
+    closed   -- True if the last vertex closes the ring onto the first, in
+                which case the first and last segments are adjacent
+    '''
+    start = vertices[:-1]
+    # Shift to a local origin to keep precision in the cross products
+    start = start - vertices.min(axis=0)
+    end = start + np.diff(vertices, axis=0)
+    n = len(start)
+    if n < 3:
+        return 0
+
+    dx = (end[:, 0] - start[:, 0])[:, None]
+    dy = (end[:, 1] - start[:, 1])[:, None]
+    # Side of segment i that the start and end of segment j are on
+    startSide = (dx * (start[:, 1][None, :] - start[:, 1][:, None]) -
+                 dy * (start[:, 0][None, :] - start[:, 0][:, None]))
+    endSide = (dx * (end[:, 1][None, :] - start[:, 1][:, None]) -
+               dy * (end[:, 0][None, :] - start[:, 0][:, None]))
+    # Segment j straddles the line of segment i, and vice versa
+    straddles = (startSide * endSide) < 0
+    crossing = straddles & straddles.T
+
+    # Only count each pair once and skip neighbouring segments, which share
+    # a vertex
+    pairs = np.triu(np.ones((n, n), dtype=bool), 2)
+    if closed:
+        pairs[0, n - 1] = False
+
+    return int((crossing & pairs).sum())
+
+def shorelineProblems(record, geometryType='polygon', expectedVertices=160,
+                      bounds=None):
+    '''
+    Quality assurance checks of a single Shoreline, run on its vertex arrays:
+        - the number of vertices (expectedVertices, None to skip)
+        - for polygons, that the ring closes into a valid ring, i.e. at least
+          three distinct vertices enclosing a non-zero area
+        - no self-intersection
+        - all vertices within the area of use of the coordinate reference
+          system (bounds, see areaOfUseBounds; None to skip)
+
+    Returns a list of descriptions of the problems found (empty if none).
+
+    Arguments:
+    record           -- Shoreline to be checked
+    geometryType     -- 'polygon', 'line' or 'both'
+    expectedVertices -- Number of vertices each shoreline should have
+    bounds           -- (xmin, ymin, xmax, ymax) the vertices should be within
+    '''
+    problems = []
+    n = record.x.size
+    if expectedVertices and n != expectedVertices:
+        problems.append('{0} vertices, {1} expected'.format(n,
+                                                            expectedVertices))
+    if n < 2:
+        problems.append('fewer than 2 vertices')
+        return problems
+
+    vertices = np.column_stack((record.x, record.y))
+    closed = geometryType != 'line'
+    if closed:
+        # Rings are closed on writing where the CSV leaves them open
+        if (vertices[0] != vertices[-1]).any():
+            vertices = np.vstack((vertices, vertices[:1]))
+        # Shoelace formula for the area enclosed by the ring
+        local = vertices - vertices.min(axis=0)
+        area = 0.5 * abs(np.dot(local[:-1, 0], local[1:, 1]) -
+                         np.dot(local[1:, 0], local[:-1, 1]))
+        if len(np.unique(vertices, axis=0)) < 3 or area == 0:
+            problems.append('ring does not close into a valid polygon')
+
+    crossings = selfIntersections(vertices, closed)
+    if crossings:
+        problems.append('{0} self-intersection(s)'.format(crossings))
+
+    if bounds is not None and (record.x.min() < bounds[0] or
+                               record.y.min() < bounds[1] or
+                               record.x.max() > bounds[2] or
+                               record.y.max() > bounds[3]):
+        problems.append('vertices outside the area of use of the coordinate '
+                        'reference system')
+
+    return problems
+
+def qaStream(records, report, geometryType='polygon', expectedVertices=160,
+             bounds=None):
+    '''
+    Pass the Shoreline records from a reader through unchanged while running
+    shorelineProblems on each, so the QA is done in the same pass as the
+    conversion. The results are accumulated in the report dictionary
+    (features, vertices and a list of (row, date/time, problem) tuples).
+
+    Arguments:
+    records          -- Iterable of Shoreline records
+    report           -- Dictionary the results are added to (see qaReport)
+    geometryType     -- 'polygon', 'line' or 'both'
+    expectedVertices -- Number of vertices each shoreline should have
+    bounds           -- (xmin, ymin, xmax, ymax) the vertices should be within
+    '''
+    report.setdefault('features', 0)
+    report.setdefault('vertices', 0)
+    report.setdefault('problems', [])
+    for record in records:
+        for problem in shorelineProblems(record, geometryType,
+                                         expectedVertices, bounds):
+            report['problems'].append((report['features'], record.dateTime,
+                                       problem))
+        report['features'] += 1
+        report['vertices'] += record.x.size
+        yield record
+
+def qaReport(report, shapePaths):
+    '''
+    Report the QA results accumulated by qaStream and check that the number
+    of features written to each output matches the number of shorelines in
+    the CSV. Returns the number of problems found.
+
+    Arguments:
+    report     -- Dictionary of results from qaStream
+    shapePaths -- Outputs written from the same records
+    '''
+    problems = list(report.get('problems', []))
+    for shapePath in shapePaths:
+        shapeData = ogr.Open(shapePath)
+        featureCount = shapeData.GetLayer(0).GetFeatureCount()
+        shapeData = None
+        if featureCount != report.get('features', 0):
+            problems.append((None, os.path.split(shapePath)[1],
+                             '{0} features written, {1} shorelines in the CSV'
+                             .format(featureCount, report.get('features', 0))))
+
+    for row, dateTime, problem in problems:
+        logAndprint('\tQA: row {0} ({1}): {2}', row, dateTime, problem,
+                    level=log.WARNING)
+    logAndprint('QA: {0} shorelines, {1} vertices, {2} problems',
+                report.get('features', 0), report.get('vertices', 0),
+                len(problems))
+
+    return len(problems)
+
+def convertCsv(csvPath, EPSG, driverName='ESRI Shapefile', batchSize=1000,
+               geometryType='polygon', reader='csv', expectedVertices=160):
+    '''
+    Convert a single CSV to an output of the same name in the same folder,
+    streaming the shorelines from the CSV to the writer. This is the unit of
+    work run in each process by batchConvert.
+
+    Returns a dictionary summarising the conversion: csv, vertices, features,
+    seconds, qaProblems (see qaReport) and error (empty unless the
+    conversion failed).
+
+    Arguments:
+    csvPath          -- Path to the CSV file to be processed
+    EPSG             -- EPSG code of the coordinate reference system of the X/Y
+                        values
+    driverName       -- OGR driver of the output, one of the outputDrivers keys
+    batchSize        -- Number of features written per transaction
+    geometryType     -- 'polygon', 'line' or 'both'
+    reader           -- CSV reader, one of the csvReaders keys ('csv' or 'mmap')
+    expectedVertices -- Number of vertices each shoreline should have (QA)
+    '''
+    t0 = time.time()
+    summary = {'csv': csvPath, 'vertices': 0, 'features': 0, 'seconds': 0.0,
+               'qaProblems': 0, 'error': ''}
+
+    report = {}
+    outputName = (os.path.splitext(os.path.split(csvPath)[1])[0] +
+                  outputDrivers[driverName])
+    try:
+        # The QA runs over the records on their way to the writer
+        records = qaStream(csvReaders[reader](csvPath), report, geometryType,
+                           expectedVertices, areaOfUseBounds(EPSG))
+        shapePaths = Write_Dict_To_Shapefile_osgeo(
+            records, outputName, EPSG, driverName, batchSize,
+            os.path.split(csvPath)[0], geometryType)
+        summary['qaProblems'] = qaReport(report, shapePaths)
+    except Exception as e:
+        summary['error'] = str(e)
+        log.exception(csvPath + ' failed processing')
+    summary['features'] = report.get('features', 0)
+    summary['vertices'] = report.get('vertices', 0)
+    summary['seconds'] = time.time() - t0
+
+    return summary
+
+def batchConvert(source, EPSG, driverName='ESRI Shapefile', batchSize=1000,
+                 workers=None, geometryType='polygon', reader='csv',
+                 expectedVertices=160):
+    '''
+    Convert every CSV in a folder, or matching a glob pattern, with one
+    output per CSV. The files are converted in parallel in a process pool and
+    a summary of the vertex count, feature count, QA problems and time taken
+    for each file is printed and logged once they are all complete.
+
+    Returns the list of summaries (see convertCsv) in CSV name order.
+
+    Arguments:
+    source           -- Folder containing the CSVs or a glob pattern of CSVs
+    EPSG             -- EPSG code of the coordinate reference system of the X/Y
+                        values
+    driverName       -- OGR driver of the outputs, one of the outputDrivers keys
+    batchSize        -- Number of features written per transaction
+    workers          -- Number of processes (default: the number of CPUs)
+    geometryType     -- 'polygon', 'line' or 'both'
+    reader           -- CSV reader, one of the csvReaders keys ('csv' or 'mmap')
+    expectedVertices -- Number of vertices each shoreline should have (QA)
+    '''
+    # Imported here so the interactive mode still runs in Python 2.7, which
+    # has no concurrent.futures
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if os.path.isdir(source):
+        csvFiles = sorted(glob.glob(os.path.join(source, '*.csv')))
+    else:
+        csvFiles = sorted(glob.glob(source))
+    logAndprint('{0} CSV files to be converted', len(csvFiles))
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convertCsv, csvPath, EPSG, driverName,
+                                   batchSize, geometryType, reader,
+                                   expectedVertices)
+                   for csvPath in csvFiles]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            logAndprint('\t{0} of {1} complete: {2}', len(summaries),
+                        len(csvFiles), os.path.split(summary['csv'])[1])
+
+    summaries.sort(key=lambda summary: summary['csv'])
+    logAndprint('\n{0:<40} {1:>10} {2:>9} {3:>6} {4:>9}', 'CSV', 'Vertices',
+                'Features', 'QA', 'Seconds')
+    for summary in summaries:
+        logAndprint('{0:<40} {1:>10} {2:>9} {3:>6} {4:>9.1f} {5}',
+                    os.path.split(summary['csv'])[1], summary['vertices'],
+                    summary['features'], summary['qaProblems'],
+                    summary['seconds'], summary['error'])
+    logAndprint('{0} of {1} CSV files converted without error',
+                len([summary for summary in summaries if not summary['error']]),
+                len(summaries))
+
+    return summaries
+
+def batchArguments(geometryType='polygon'):
+    r'''
+    Parse the command line of a batch (non-interactive) run, e.g.
+        python BNH_CRC_CSVtoShapeFile.py "C:\surge\ensemble_*.csv" 28356
+
+    Arguments:
+    geometryType -- Default of the --geometry option. The --vertices check
+                    is off by default for 'line' as the vertex counts of the
+                    lines vary (they match the CSV rather than 160)
+    '''
+    expectedVertices = 0 if geometryType == 'line' else 160
+    parser = argparse.ArgumentParser(
+        description='Convert storm surge shoreline CSVs in parallel')
+    parser.add_argument('source',
+                        help='Folder containing the CSVs, or a glob pattern')
+    parser.add_argument('EPSG', type=int,
+                        help='EPSG code of the X/Y values, e.g. 28356')
+    parser.add_argument('--driver', default='ESRI Shapefile',
+                        choices=list(outputDrivers),
+                        help='Output format (default: ESRI Shapefile)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Features per transaction (GeoPackage)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of processes (default: CPU count)')
+    parser.add_argument('--geometry', default=geometryType,
+                        choices=['polygon', 'line', 'both'],
+                        help='Shorelines written as polygons, lines or both '
+                        '(default: {0})'.format(geometryType))
+    parser.add_argument('--vertices', type=int, default=expectedVertices,
+                        help='Vertices expected per shoreline, 0 to skip the '
+                        'check (default: {0})'.format(expectedVertices))
+    parser.add_argument('--reader', default='csv', choices=sorted(csvReaders),
+                        help='CSV reader, mmap is faster for purely numeric '
+                        'CSVs (default: csv)')
+
+    return parser.parse_args()
+
 #==============================================================================
 # Mainline
 #==============================================================================
@@ -353,18 +1052,51 @@ if __name__ == '__main__':
     # Start the timer
     t0 = time.time()
 
-     # Required user input to specify the workspace where the CSV to be processed exists
-    workspace = raw_input('Enter the folder containing the CSV to be processed: ')
-
-    # EPSG code representing the coordinate reference system of the XY pairs in the CSV
-    # 28356 =  GDA94 MGA 56
-    EPSG = 28356
-
-    # CSV to be processed in the workspace
-    csvFile = raw_input('Enter the CSV file name of the file to be processed: ')
-
-    # Shapefile to be created
-    shapefileName = csvFile.split('.')[0] + r'.shp'
+    # Batch mode: when a folder or glob of CSVs and an EPSG code are given on
+    # the command line the CSVs are converted in parallel without prompting
+    # (see batchArguments). Otherwise a single CSV is converted interactively.
+    args = batchArguments() if len(sys.argv) > 1 else None
+
+    if args:
+        if os.path.isdir(args.source):
+            workspace = args.source
+        else:
+            workspace = os.path.split(os.path.abspath(args.source))[0]
+        EPSG = args.EPSG
+        outputDriver = args.driver
+        batchSize = args.batch_size
+        geometryType = args.geometry
+        reader = args.reader
+        expectedVertices = args.vertices
+    else:
+        # Required user input to specify the workspace where the CSV to be processed exists
+        workspace = raw_input('Enter the folder containing the CSV to be processed: ')
+
+        # EPSG code representing the coordinate reference system of the XY pairs in the CSV
+        # 28356 =  GDA94 MGA 56
+        EPSG = 28356
+
+        # CSV to be processed in the workspace
+        csvFile = raw_input('Enter the CSV file name of the file to be processed: ')
+
+        # Shapefile to be created
+        # OGR driver of the output and the number of features committed per
+        # transaction (GeoPackage only)
+        outputDriver = 'ESRI Shapefile'
+        batchSize = 1000
+
+        # Shorelines written as 'polygon', 'line' or 'both' (the lines are
+        # written to a second output with a '_line' suffix)
+        geometryType = 'polygon'
+
+        # Reader used when streaming: 'csv', or 'mmap' for the faster memory
+        # mapped reader of purely numeric CSVs
+        reader = 'csv'
+
+        # Number of vertices each shoreline should have (QA check)
+        expectedVertices = 160
+
+        shapefileName = csvFile.split('.')[0] + outputDrivers[outputDriver]
 
     # Test to ensure the workspace provided exists
     os.path.exists(workspace)
@@ -376,15 +1108,19 @@ if __name__ == '__main__':
     # Create a unique logfile based on date and integer
     versionStub = stub(os.path.join(workspace,r'logfile.log'))
     logfile = os.path.join(workspace, r'logfile_' + versionStub + '.log')
-    print '\nlogfile name:' + logfile
+    print('\nlogfile name:' + logfile)
 
     #Copy the python file being run to the destination folder to keep a copy of the script with the outputs
     # Use the versionStub so as to link the log file with the Python script
     shutil.copy2(sys.argv[0], os.path.join(workspace, os.path.split(sys.argv[0])[1].split('.')[0] + '_' + versionStub + '.py'))
 
+    # Verbosity of the console and logfile messages: log.INFO for progress,
+    # log.DEBUG to trace each feature, TRACE to trace each vertex
+    verbosity = log.INFO
+
     # Configure the logfile
     log.basicConfig(filename=logfile,
-                    level=log.DEBUG,
+                    level=min(verbosity, log.DEBUG),
                     filemode='w',# 'w' = overwrite log file, 'a' = append
                     format='%(asctime)s,   Line:%(lineno)d %(levelname)s: %(message)s',
                     datefmt='%a %d/%b/%Y %I:%M:%S %p')
@@ -393,26 +1129,49 @@ if __name__ == '__main__':
     # Log the path and name of the script used to the logfile
     log.info('Script started: ' + sys.argv[0])
 #    assert os.path.exists(logfile)
-    # Log the input CSV and the workspace
-    log.info('Input CSV: ' + os.path.join(workspace, csvFile))
+    # Log the workspace and the input CSV(s)
     log.info('Workspace: ' + workspace)
 
+    if args:
+        log.info('Batch source: ' + args.source)
+        batchConvert(args.source, EPSG, outputDriver, batchSize,
+                     args.workers, geometryType, reader, expectedVertices)
+    else:
+        log.info('Input CSV: ' + os.path.join(workspace, csvFile))
+
+
+        shoreline = os.path.join(workspace, csvFile)
 
-    shoreline = os.path.join(workspace, csvFile)
+        # Stream each X/Y row pair straight into the shapefile rather than
+        # holding the whole CSV in memory. Set to False to build totalList first.
+        streaming = True
 
-    dictionary = {}
+        dictionary = {}
 
 
 
-    # List to contain dictionaries
-    totalList = []
+        # List to contain dictionaries
+        totalList = []
 
-    csvProcessing()
+        if streaming:
+            # QA checks are run on the records on their way to the writer
+            report = {}
+            records = qaStream(csvReaders[reader](shoreline), report,
+                               geometryType, expectedVertices,
+                               areaOfUseBounds(EPSG))
+            shapePaths = Write_Dict_To_Shapefile_osgeo(
+                records, shapefileName, EPSG, outputDriver, batchSize,
+                workspace, geometryType)
+            qaReport(report, shapePaths)
+        else:
+            csvProcessing()
 
 
-    logAndprint('\ntotalList length: {0}'.format(len(totalList)))
+            logAndprint('\ntotalList length: {0}', len(totalList))
 
-    Write_Dict_To_Shapefile_osgeo(totalList, shapefileName, EPSG)
+            Write_Dict_To_Shapefile_osgeo(totalList, shapefileName, EPSG,
+                                          outputDriver, batchSize, workspace,
+                                          geometryType)
 #    for entry in totalList:
 #        print entry
 #    print len(totalList)
@@ -422,5 +1181,5 @@ if __name__ == '__main__':
     # Print the duration of the script to screen and capture in the log file
     print('\nFinished at: ' + time.strftime("%c", time.localtime(time.time())))
     finishMsg = timer(t0)
-    print finishMsg
+    print(finishMsg)
     log.info(finishMsg)